@@ -28,4 +28,96 @@ try:
 except Exception as e:
     print(f"Firestore client initialization failed: {e}")
     print("Firestore operations will not work without proper Firebase configuration")
-    db = None
\ No newline at end of file
+    db = None
+
+# Size of the thread pool used to run blocking Firestore calls off the event loop
+FIRESTORE_MAX_WORKERS = int(os.getenv("FIRESTORE_MAX_WORKERS", "16"))
+
+# Team membership cache used by authorization checks
+TEAM_MEMBERSHIP_CACHE_TTL = float(os.getenv("TEAM_MEMBERSHIP_CACHE_TTL", "60"))
+TEAM_MEMBERSHIP_CACHE_SIZE = int(os.getenv("TEAM_MEMBERSHIP_CACHE_SIZE", "10000"))
+
+# Cache of verified Firebase ID tokens (entries also expire with the token itself)
+TOKEN_CACHE_TTL = float(os.getenv("TOKEN_CACHE_TTL", "300"))
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+
+# Storage backend: "firestore" (default), "memory" or "sqlite" for local load testing
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "firestore")
+SQLITE_DB_PATH = os.getenv("SQLITE_DB_PATH", "local_storage.sqlite3")
+
+# Seconds a WebSocket send may take before the connection is treated as dead and evicted
+WEBSOCKET_SEND_TIMEOUT = float(os.getenv("WEBSOCKET_SEND_TIMEOUT", "5"))
+
+# Per-connection outbound queue: frames buffered per WebSocket before the overflow policy applies.
+# "drop_typing" discards typing frames first and disconnects only if the queue is still full;
+# "disconnect" disconnects as soon as the queue is full.
+WEBSOCKET_SEND_QUEUE_SIZE = int(os.getenv("WEBSOCKET_SEND_QUEUE_SIZE", "256"))
+WEBSOCKET_OVERFLOW_POLICY = os.getenv("WEBSOCKET_OVERFLOW_POLICY", "drop_typing")
+
+# Pub/sub used to fan WebSocket broadcasts out across workers: "memory" (single process) or "redis"
+PUBSUB_BACKEND = os.getenv("PUBSUB_BACKEND", "memory")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+PUBSUB_CHANNEL_PREFIX = os.getenv("PUBSUB_CHANNEL_PREFIX", "chat:team:")
+
+# Write-behind persistence for WebSocket chat messages: broadcast first, then persist in background batches
+CHAT_WRITE_BEHIND = os.getenv("CHAT_WRITE_BEHIND", "false").lower() in ("1", "true", "yes")
+WRITE_BEHIND_FLUSH_INTERVAL = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", "0.2"))
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "250"))
+WRITE_BEHIND_MAX_RETRY_DELAY = float(os.getenv("WRITE_BEHIND_MAX_RETRY_DELAY", "30"))
+
+# Minimum seconds between writes of a team's last_message_at (the in-memory value is always exact)
+LAST_MESSAGE_AT_WRITE_INTERVAL = float(os.getenv("LAST_MESSAGE_AT_WRITE_INTERVAL", "5"))
+
+# Per-team ring buffer of recent messages, and the most messages replayed to a reconnecting client
+MESSAGE_BUFFER_SIZE = int(os.getenv("MESSAGE_BUFFER_SIZE", "200"))
+WS_SYNC_MAX_MESSAGES = int(os.getenv("WS_SYNC_MAX_MESSAGES", "100"))
+# Idle teams are evicted least-recently-used first once either limit is exceeded
+MESSAGE_BUFFER_MAX_TEAMS = int(os.getenv("MESSAGE_BUFFER_MAX_TEAMS", "1000"))
+MESSAGE_BUFFER_MAX_BYTES = int(os.getenv("MESSAGE_BUFFER_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# Typing indicators: at most one state change per user per throttle interval, published as one
+# coalesced frame per room per broadcast interval; typing expires without a refresh within the timeout
+TYPING_THROTTLE_INTERVAL = float(os.getenv("TYPING_THROTTLE_INTERVAL", "1.0"))
+TYPING_BROADCAST_INTERVAL = float(os.getenv("TYPING_BROADCAST_INTERVAL", "0.5"))
+TYPING_TIMEOUT = float(os.getenv("TYPING_TIMEOUT", "6.0"))
+
+# Dead sockets are detected with WebSocket protocol pings, which browsers answer automatically
+WEBSOCKET_PING_INTERVAL = float(os.getenv("WEBSOCKET_PING_INTERVAL", "20"))
+WEBSOCKET_PING_TIMEOUT = float(os.getenv("WEBSOCKET_PING_TIMEOUT", "20"))
+
+# Shared presence (Redis broker only): each worker refreshes its entries every interval and
+# entries of a worker that stopped refreshing expire after the timeout
+PRESENCE_REFRESH_INTERVAL = float(os.getenv("PRESENCE_REFRESH_INTERVAL", "25"))
+PRESENCE_TIMEOUT = float(os.getenv("PRESENCE_TIMEOUT", "60"))
+PRESENCE_KEY_PREFIX = os.getenv("PRESENCE_KEY_PREFIX", "chat:presence:")
+
+# Persistent vector store shared by vector_db_service and chroma_service, and the reindex batch size
+CHROMA_DB_PATH = os.getenv("CHROMA_DB_PATH", "./chroma_db")
+VECTOR_REINDEX_BATCH_SIZE = int(os.getenv("VECTOR_REINDEX_BATCH_SIZE", "500"))
+
+# Background vector indexing of new messages: bounded queue (oldest dropped when full), drained in
+# micro-batches; a failing batch is retried with backoff and given up after VECTOR_INDEX_MAX_ATTEMPTS
+VECTOR_INDEX_QUEUE_SIZE = int(os.getenv("VECTOR_INDEX_QUEUE_SIZE", "10000"))
+VECTOR_INDEX_BATCH_SIZE = int(os.getenv("VECTOR_INDEX_BATCH_SIZE", "64"))
+VECTOR_INDEX_FLUSH_INTERVAL = float(os.getenv("VECTOR_INDEX_FLUSH_INTERVAL", "0.5"))
+VECTOR_INDEX_MAX_RETRY_DELAY = float(os.getenv("VECTOR_INDEX_MAX_RETRY_DELAY", "30"))
+VECTOR_INDEX_MAX_ATTEMPTS = int(os.getenv("VECTOR_INDEX_MAX_ATTEMPTS", "5"))
+
+# Process-wide embedding model shared by the vector stores: "onnx" (Chroma's bundled all-MiniLM-L6-v2)
+# or "sentence-transformers" (EMBEDDING_MODEL). Concurrent requests are collected for up to
+# EMBEDDING_BATCH_WAIT seconds (or EMBEDDING_BATCH_SIZE texts) and run as one batch on one of
+# EMBEDDING_THREADS inference threads.
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "onnx")
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+EMBEDDING_BATCH_WAIT = float(os.getenv("EMBEDDING_BATCH_WAIT", "0.005"))
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "1"))
+
+# LRU cache of query embeddings (one 384-float vector, ~1.5 KB, per entry with the default model)
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "10000"))
+QUERY_EMBEDDING_CACHE_TTL = float(os.getenv("QUERY_EMBEDDING_CACHE_TTL", "3600"))
+
+# Content-hash -> embedding store consulted before embedding documents (repeated texts like "ok" or
+# bot notices reuse their vector), and the minimum stripped length of a chat message worth indexing
+DOCUMENT_EMBEDDING_CACHE_SIZE = int(os.getenv("DOCUMENT_EMBEDDING_CACHE_SIZE", "20000"))
+VECTOR_INDEX_MIN_CHARS = int(os.getenv("VECTOR_INDEX_MIN_CHARS", "0"))
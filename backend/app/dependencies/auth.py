@@ -1,13 +1,33 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from firebase_admin import auth
+import hashlib
+import time
+from app.config import TOKEN_CACHE_SIZE, TOKEN_CACHE_TTL
+from app.services.cache_service import TTLCache
+from app.services.metrics_service import register_provider
 
 security = HTTPBearer()
 
+# sha256(token) -> decoded token; entries never outlive the token's own exp claim
+token_cache = TTLCache(max_size=TOKEN_CACHE_SIZE, ttl_seconds=TOKEN_CACHE_TTL)
+register_provider("token_cache", token_cache.stats)
+
+def verify_token(token: str) -> dict:
+    """Verify a Firebase ID token, reusing earlier verifications of the same token until it expires"""
+    key = hashlib.sha256(token.encode("utf-8")).hexdigest()
+    decoded_token = token_cache.get(key)
+    if decoded_token is None:
+        decoded_token = auth.verify_id_token(token)
+        remaining = decoded_token.get("exp", 0) - time.time()
+        if remaining > 0:
+            token_cache.set(key, decoded_token, ttl_seconds=min(TOKEN_CACHE_TTL, remaining))
+    return dict(decoded_token)
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     try:
         token = credentials.credentials
-        decoded_token = auth.verify_id_token(token)
+        decoded_token = verify_token(token)
         return decoded_token
     except Exception as e:
         print(f"Authentication error: {str(e)}")
@@ -19,7 +39,7 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
 async def get_current_user_websocket(token: str):
     """Get current user for WebSocket connections"""
     try:
-        decoded_token = auth.verify_id_token(token)
+        decoded_token = verify_token(token)
         return decoded_token
     except Exception:
-        return None
\ No newline at end of file
+        return None
@@ -0,0 +1,28 @@
+from fastapi import Depends, HTTPException, status
+from app.dependencies.auth import get_current_user
+from app.services.team_membership_service import get_team_membership, is_team_member
+
+async def ensure_team_member(
+    team_id: str,
+    user_id: str,
+    detail: str = "You don't have access to this team"
+) -> dict:
+    """Return the team's cached membership, raising 404/403 if the user may not access it"""
+    membership = await get_team_membership(team_id)
+    if not membership:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Team not found"
+        )
+
+    if not is_team_member(membership, user_id):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=detail
+        )
+
+    return membership
+
+async def require_team_member(team_id: str, current_user: dict = Depends(get_current_user)) -> dict:
+    """Dependency for routes with a {team_id} path parameter that only team members may call"""
+    return await ensure_team_member(team_id, current_user.get("uid"))
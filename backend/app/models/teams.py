@@ -25,8 +25,10 @@ class Team(TeamBase):
     admin_id: str
     admin_email: str
     members: List[TeamMember] = []
+    member_ids: List[str] = []  # admin + member user ids, indexed for membership lookups
     created_at: datetime
     updated_at: Optional[datetime] = None
+    last_message_at: Optional[datetime] = None
 
 class TeamInvite(BaseModel):
     team_id: str
@@ -2,6 +2,7 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
 from app.dependencies.auth import get_current_user
+from fastapi.concurrency import run_in_threadpool
 from app.services.assistant_service import assistant_service
 
 router = APIRouter(prefix="/api/assistant", tags=["assistant"])
@@ -81,7 +82,7 @@ async def clear_conversation_history(
     """Clear conversation history for the current user in a specific project"""
     try:
         user_id = current_user.get("uid")
-        assistant_service.clear_history(user_id, project_id)
+        await assistant_service.clear_history(user_id, project_id)
         
         return StatusResponse(
             success=True,
@@ -101,7 +102,7 @@ async def get_conversation_history(
     """Get conversation history for the current user in a specific project"""
     try:
         user_id = current_user.get("uid")
-        history = assistant_service.get_conversation_history(user_id, project_id)
+        history = await assistant_service.get_conversation_history(user_id, project_id)
         
         return {
             "history": history,
@@ -125,7 +126,8 @@ async def add_project_knowledge(
     This allows the assistant to provide context-aware responses about specific projects
     """
     try:
-        success = assistant_service.add_project_knowledge(
+        success = await run_in_threadpool(
+            assistant_service.add_project_knowledge,
             project_id=request.project_id,
             project_name=request.project_name,
             description=request.description,
@@ -159,7 +161,8 @@ async def add_code_knowledge(
     This allows the assistant to reference and suggest code from your projects
     """
     try:
-        success = assistant_service.add_code_knowledge(
+        success = await run_in_threadpool(
+            assistant_service.add_code_knowledge,
             code_id=request.code_id,
             code=request.code,
             language=request.language,
@@ -190,7 +193,7 @@ async def get_all_project_chats(
     """Get all ThinkBuddy chat sessions for the current user across all projects"""
     try:
         user_id = current_user.get("uid")
-        chats = assistant_service.get_all_project_chats(user_id)
+        chats = await assistant_service.get_all_project_chats(user_id)
         
         return {
             "chats": chats,
@@ -2,7 +2,7 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel
 from firebase_admin import auth
-from ..dependencies.auth import get_current_user
+from ..dependencies.auth import get_current_user, verify_token as verify_id_token_cached
 
 router = APIRouter(prefix="/auth", tags=["authentication"])
 security = HTTPBearer()
@@ -36,7 +36,7 @@ async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(secur
     """
     try:
         token = credentials.credentials
-        decoded_token = auth.verify_id_token(token)
+        decoded_token = verify_id_token_cached(token)
         return {
             "valid": True,
             "uid": decoded_token["uid"],
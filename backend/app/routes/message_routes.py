@@ -1,13 +1,20 @@
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import APIRouter, HTTPException, Depends, Query, Response, status
 from datetime import datetime
 from typing import List, Optional
 from app.models.message import Message, MessageCreate, MessageUpdate, MessageStatus
-from app.services.firestore_service import (
-    create_document, get_document, get_team_messages as fetch_team_messages, 
+from app.services.async_firestore_service import (
+    create_document, get_document, get_team_messages_page, 
     update_document, delete_document, get_user_by_email
 )
-from app.services.vector_db_service import add_message_to_vector_db
+from app.services.message_indexer_service import message_indexer
+from app.services.firestore_service import encode_message_cursor
+from app.services.storage_service import ArrayUnion, ArrayRemove
+from app.services.websocket_service import manager
+from app.services.team_activity_service import last_message_at_updater
+from app.services.message_buffer_service import message_buffer
 from app.dependencies.auth import get_current_user
+from app.dependencies.teams import ensure_team_member, require_team_member
+from app.services.team_membership_service import get_team_membership
 import uuid
 
 router = APIRouter(prefix="/messages", tags=["messages"])
@@ -18,23 +25,14 @@ async def create_message(
     current_user: dict = Depends(get_current_user)
 ):
     """Create a new message in a team chat"""
-    # Verify user is member of the team
-    team = get_document("teams", message_data.team_id)
-    if not team:
-        raise HTTPException(status_code=404, detail="Team not found")
-    
     user_id = current_user.get("uid")
     user_email = current_user.get("email")
     
-    # Check if user is member of this team
-    is_member = (team.get("admin_id") == user_id or 
-                any(member.get("user_id") == user_id for member in team.get("members", [])))
-    
-    if not is_member:
-        raise HTTPException(status_code=403, detail="You are not a member of this team")
+    # Verify user is member of the team
+    await ensure_team_member(message_data.team_id, user_id, "You are not a member of this team")
     
     # Get or create user info for sender details
-    user_info = get_user_by_email(user_email)
+    user_info = await get_user_by_email(user_email)
     if not user_info:
         # Auto-create user profile if it doesn't exist
         user_info = {
@@ -44,7 +42,7 @@ async def create_message(
             "myTeams": [],
             "created_at": datetime.utcnow()
         }
-        create_document("users", user_id, user_info)
+        await create_document("users", user_id, user_info)
     
     sender_name = user_info.get("name", user_email.split("@")[0])
     
@@ -62,49 +60,56 @@ async def create_message(
         created_at=datetime.utcnow()
     )
     
-    create_document("messages", message_id, message.dict())
-    
-    # Add message to vector database for RAG
-    if message_data.message_type == "text" and message_data.content:
-        add_message_to_vector_db(
-            message_id=message_id,
-            content=message_data.content,
-            metadata={
-                "team_id": message_data.team_id,
-                "sender_name": sender_name,
-                "sender_id": user_id,
-                "timestamp": message.created_at.isoformat(),
-                "message_type": message_data.message_type
-            }
-        )
-    
-    # Update team's last message timestamp
-    update_document("teams", message_data.team_id, {"last_message_at": datetime.utcnow()})
+    await create_document("messages", message_id, message.dict())
+    message_buffer.add(message.dict())
+    # Connected clients, and other workers' recent-message buffers, learn about it through the broker
+    await manager.broadcast_message_to_team(message_data.team_id, message.dict())
+    
+    # Embedded into the vector database for RAG in the background
+    message_indexer.enqueue(message.dict())
+    
+    # Update team's last message timestamp (persisted by the debounced updater)
+    last_message_at_updater.touch(message_data.team_id, message.created_at)
     
     return message
 
 @router.get("/{team_id}", response_model=List[Message])
 async def get_team_messages_endpoint(
     team_id: str,
-    limit: int = 50,
-    current_user: dict = Depends(get_current_user)
+    response: Response,
+    limit: int = Query(50, ge=1, le=500),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    membership: dict = Depends(require_team_member)
 ):
-    """Get messages for a specific team"""
-    # Verify user is member of the team
-    team = get_document("teams", team_id)
-    if not team:
-        raise HTTPException(status_code=404, detail="Team not found")
-    
-    user_id = current_user.get("uid")
-    
-    # Check if user is member of this team
-    is_member = (team.get("admin_id") == user_id or 
-                any(member.get("user_id") == user_id for member in team.get("members", [])))
-    
-    if not is_member:
-        raise HTTPException(status_code=403, detail="You are not a member of this team")
-    
-    messages = fetch_team_messages(team_id, limit)
+    """
+    Get messages for a specific team, oldest first
+
+    - **before**: cursor to load older history (from a previous X-Next-Cursor header)
+    - **after**: cursor to load messages newer than a known position
+
+    The cursor for the following page is returned in the X-Next-Cursor header
+    and is omitted when there are no more messages in that direction.
+    """
+    if before and after:
+        raise HTTPException(status_code=400, detail="Use either 'before' or 'after', not both")
+    
+    messages = None
+    if not before and not after and limit <= message_buffer.capacity and message_buffer.serves(team_id):
+        # Latest page: served from the in-memory recent-message buffer
+        try:
+            messages, has_more = await message_buffer.get_latest(team_id, limit)
+            next_cursor = encode_message_cursor(messages[0]) if has_more and messages else None
+        except Exception as e:
+            print(f"Recent-message buffer unavailable for team {team_id}: {e}")
+    if messages is None:
+        try:
+            messages, next_cursor = await get_team_messages_page(team_id, limit, before=before, after=after)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return messages
 
 
@@ -115,7 +120,7 @@ async def update_message(
     current_user: dict = Depends(get_current_user)
 ):
     """Update a message (only by sender)"""
-    message = get_document("messages", message_id)
+    message = await get_document("messages", message_id)
     if not message:
         raise HTTPException(status_code=404, detail="Message not found")
     
@@ -125,8 +130,13 @@ async def update_message(
     
     update_data = message_update.dict(exclude_unset=True)
     if update_data:
-        update_document("messages", message_id, update_data)
+        await update_document("messages", message_id, update_data)
         message.update(update_data)
+        message_buffer.update(message.get("teamId"), message_id, update_data)
+        await manager.broadcast_message_event_to_team(message.get("teamId"), {
+            "type": "message_updated",
+            "message": message
+        })
     
     return message
 
@@ -136,21 +146,26 @@ async def delete_message(
     current_user: dict = Depends(get_current_user)
 ):
     """Delete a message (only by sender or team admin)"""
-    message = get_document("messages", message_id)
+    message = await get_document("messages", message_id)
     if not message:
         raise HTTPException(status_code=404, detail="Message not found")
     
     user_id = current_user.get("uid")
     
     # Check if user is sender or team admin
-    team = get_document("teams", message.get("teamId"))
-    is_admin = team and team.get("admin_id") == user_id
+    membership = await get_team_membership(message.get("teamId"))
+    is_admin = membership and membership["admin_id"] == user_id
     is_sender = message.get("senderId") == user_id
     
     if not (is_sender or is_admin):
         raise HTTPException(status_code=403, detail="You can only delete your own messages or be team admin")
     
-    delete_document("messages", message_id)
+    await delete_document("messages", message_id)
+    message_buffer.remove(message.get("teamId"), message_id)
+    await manager.broadcast_message_event_to_team(message.get("teamId"), {
+        "type": "message_deleted",
+        "message_id": message_id
+    })
     return {"message": "Message deleted successfully"}
 
 @router.post("/{message_id}/react")
@@ -160,20 +175,21 @@ async def add_reaction(
     current_user: dict = Depends(get_current_user)
 ):
     """Add a reaction to a message"""
-    message = get_document("messages", message_id)
+    message = await get_document("messages", message_id)
     if not message:
         raise HTTPException(status_code=404, detail="Message not found")
     
-    user_email = current_user.get("email")
-    reactions = message.get("reactions", {})
+    # Verify user is member of the team (reactions are broadcast to its room)
+    await ensure_team_member(message.get("teamId"), current_user.get("uid"), "You are not a member of this team")
     
-    if emoji not in reactions:
-        reactions[emoji] = []
+    user_email = current_user.get("email")
     
     # Add user to reaction if not already there
-    if user_email not in reactions[emoji]:
-        reactions[emoji].append(user_email)
-        update_document("messages", message_id, {"reactions": reactions})
+    if user_email not in (message.get("reactions") or {}).get(emoji, []):
+        # Field-level ArrayUnion so concurrent reactions never overwrite each other
+        await update_document("messages", message_id, {("reactions", emoji): ArrayUnion([user_email])})
+        message_buffer.react(message.get("teamId"), message_id, emoji, user_email, added=True)
+        await manager.broadcast_reaction_to_team(message.get("teamId"), "reaction_added", message_id, emoji, user_email)
         return {"message": "Reaction added successfully"}
     
     raise HTTPException(status_code=400, detail="You have already reacted with this emoji")
@@ -185,19 +201,20 @@ async def remove_reaction(
     current_user: dict = Depends(get_current_user)
 ):
     """Remove a reaction from a message"""
-    message = get_document("messages", message_id)
+    message = await get_document("messages", message_id)
     if not message:
         raise HTTPException(status_code=404, detail="Message not found")
     
+    # Verify user is member of the team (reactions are broadcast to its room)
+    await ensure_team_member(message.get("teamId"), current_user.get("uid"), "You are not a member of this team")
+    
     user_email = current_user.get("email")
-    reactions = message.get("reactions", {})
-    
-    if emoji in reactions and user_email in reactions[emoji]:
-        reactions[emoji].remove(user_email)
-        # Remove emoji if no reactions left
-        if not reactions[emoji]:
-            del reactions[emoji]
-        update_document("messages", message_id, {"reactions": reactions})
+    
+    if user_email in (message.get("reactions") or {}).get(emoji, []):
+        # ArrayRemove leaves an empty list behind; clients treat it as no reactions
+        await update_document("messages", message_id, {("reactions", emoji): ArrayRemove([user_email])})
+        message_buffer.react(message.get("teamId"), message_id, emoji, user_email, added=False)
+        await manager.broadcast_reaction_to_team(message.get("teamId"), "reaction_removed", message_id, emoji, user_email)
         return {"message": "Reaction removed successfully"}
     
     raise HTTPException(status_code=400, detail="Reaction not found")
@@ -209,27 +226,18 @@ async def reply_to_message(
     current_user: dict = Depends(get_current_user)
 ):
     """Reply to a specific message"""
-    original_message = get_document("messages", message_id)
+    original_message = await get_document("messages", message_id)
     if not original_message:
         raise HTTPException(status_code=404, detail="Original message not found")
     
-    # Verify user is member of the team
-    team = get_document("teams", original_message.get("teamId"))
-    if not team:
-        raise HTTPException(status_code=404, detail="Team not found")
-    
     user_id = current_user.get("uid")
     user_email = current_user.get("email")
     
-    # Check if user is member of this team
-    is_member = (team.get("admin_id") == user_id or 
-                any(member.get("user_id") == user_id for member in team.get("members", [])))
-    
-    if not is_member:
-        raise HTTPException(status_code=403, detail="You are not a member of this team")
+    # Verify user is member of the team
+    await ensure_team_member(original_message.get("teamId"), user_id, "You are not a member of this team")
     
     # Get or create user info for sender details
-    user_info = get_user_by_email(user_email)
+    user_info = await get_user_by_email(user_email)
     if not user_info:
         # Auto-create user profile if it doesn't exist
         user_info = {
@@ -239,7 +247,7 @@ async def reply_to_message(
             "myTeams": [],
             "created_at": datetime.utcnow()
         }
-        create_document("users", user_id, user_info)
+        await create_document("users", user_id, user_info)
     
     sender_name = user_info.get("name", user_email.split("@")[0])
     
@@ -256,9 +264,14 @@ async def reply_to_message(
         created_at=datetime.utcnow()
     )
     
-    create_document("messages", reply_id, reply.dict())
+    await create_document("messages", reply_id, reply.dict())
+    message_buffer.add(reply.dict())
+    await manager.broadcast_message_to_team(original_message.get("teamId"), reply.dict())
+    
+    # Embedded into the vector database for RAG in the background
+    message_indexer.enqueue(reply.dict())
     
-    # Update team's last message timestamp
-    update_document("teams", original_message.get("teamId"), {"last_message_at": datetime.utcnow()})
+    # Update team's last message timestamp (persisted by the debounced updater)
+    last_message_at_updater.touch(original_message.get("teamId"), reply.created_at)
     
     return reply
\ No newline at end of file
@@ -2,11 +2,15 @@ from fastapi import APIRouter, HTTPException, Depends, status
 from datetime import datetime
 from typing import List
 from app.models.summary import Summary, SummaryCreate, SummaryResponse
-from app.services.firestore_service import (
-    create_document, get_document, query_collection, get_team_messages
+from app.services.async_firestore_service import (
+    create_document, get_document, query_collection
 )
+from app.services.message_buffer_service import message_buffer
 from app.services.gemini_service import generate_summary_from_messages
+from fastapi.concurrency import run_in_threadpool
 from app.dependencies.auth import get_current_user
+from app.dependencies.teams import ensure_team_member, require_team_member
+from app.services.team_membership_service import get_team_membership
 import uuid
 
 router = APIRouter(prefix="/summaries", tags=["summaries"])
@@ -18,32 +22,14 @@ async def generate_team_summary(
 ):
     """Generate a summary for a team's chat messages using Hugging Face"""
     team_id = summary_data.team_id
-    
-    # Verify team exists and user has access
-    team = get_document("teams", team_id)
-    if not team:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Team not found"
-        )
-    
     user_id = current_user.get("uid")
     user_email = current_user.get("email")
     
-    # Check if user is member of this team
-    is_member = (
-        team.get("admin_id") == user_id or
-        any(member.get("user_id") == user_id for member in team.get("members", []))
-    )
-    
-    if not is_member:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="You don't have access to this team"
-        )
+    # Verify team exists and user has access
+    await ensure_team_member(team_id, user_id)
     
     # Fetch team messages
-    messages = get_team_messages(team_id, limit=summary_data.message_count or 100)
+    messages = await message_buffer.get_recent_messages(team_id, limit=summary_data.message_count or 100)
     
     if not messages:
         raise HTTPException(
@@ -52,8 +38,8 @@ async def generate_team_summary(
         )
     
     try:
-        # Generate summary directly using Gemini
-        result = generate_summary_from_messages(messages)
+        # Generate summary directly using Gemini (blocking HTTP call, keep it off the event loop)
+        result = await run_in_threadpool(generate_summary_from_messages, messages)
         
         # Create summary document
         summary_id = str(uuid.uuid4())
@@ -73,7 +59,7 @@ async def generate_team_summary(
         }
         
         # Save to Firestore
-        create_document("summaries", summary_id, summary_doc)
+        await create_document("summaries", summary_id, summary_doc)
         
         return SummaryResponse(
             summary_id=summary_id,
@@ -97,31 +83,11 @@ async def generate_team_summary(
 @router.get("/team/{team_id}", response_model=List[SummaryResponse])
 async def get_team_summaries(
     team_id: str,
-    current_user: dict = Depends(get_current_user)
+    membership: dict = Depends(require_team_member)
 ):
     """Get all summaries for a specific team"""
-    # Verify team exists and user has access
-    team = get_document("teams", team_id)
-    if not team:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Team not found"
-        )
-    
-    user_id = current_user.get("uid")
-    is_member = (
-        team.get("admin_id") == user_id or
-        any(member.get("user_id") == user_id for member in team.get("members", []))
-    )
-    
-    if not is_member:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="You don't have access to this team"
-        )
-    
     # Fetch summaries for this team
-    summaries = query_collection("summaries", "team_id", "==", team_id)
+    summaries = await query_collection("summaries", "team_id", "==", team_id)
     
     # Convert to response models
     result = []
@@ -150,7 +116,7 @@ async def get_summary_by_id(
     current_user: dict = Depends(get_current_user)
 ):
     """Get a specific summary by ID"""
-    summary = get_document("summaries", summary_id)
+    summary = await get_document("summaries", summary_id)
     if not summary:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -158,24 +124,7 @@ async def get_summary_by_id(
         )
     
     # Verify user has access to the team
-    team = get_document("teams", summary["team_id"])
-    if not team:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Team not found"
-        )
-    
-    user_id = current_user.get("uid")
-    is_member = (
-        team.get("admin_id") == user_id or
-        any(member.get("user_id") == user_id for member in team.get("members", []))
-    )
-    
-    if not is_member:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="You don't have access to this summary"
-        )
+    await ensure_team_member(summary["team_id"], current_user.get("uid"), "You don't have access to this summary")
     
     return SummaryResponse(
         summary_id=summary["summary_id"],
@@ -196,7 +145,7 @@ async def delete_summary(
     current_user: dict = Depends(get_current_user)
 ):
     """Delete a summary"""
-    summary = get_document("summaries", summary_id)
+    summary = await get_document("summaries", summary_id)
     if not summary:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -206,9 +155,9 @@ async def delete_summary(
     user_id = current_user.get("uid")
     
     # Only creator or team admin can delete
-    team = get_document("teams", summary["team_id"])
+    team = await get_team_membership(summary["team_id"])
     is_creator = summary["created_by"] == user_id
-    is_admin = team and team.get("admin_id") == user_id
+    is_admin = team and team["admin_id"] == user_id
     
     if not (is_creator or is_admin):
         raise HTTPException(
@@ -216,6 +165,6 @@ async def delete_summary(
             detail="Only the creator or team admin can delete this summary"
         )
     
-    from app.services.firestore_service import delete_document
-    delete_document("summaries", summary_id)
+    from app.services.async_firestore_service import delete_document
+    await delete_document("summaries", summary_id)
     return None
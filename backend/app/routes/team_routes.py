@@ -2,27 +2,34 @@ from fastapi import APIRouter, HTTPException, Depends, status
 from datetime import datetime, timedelta
 from typing import List
 from app.models.teams import Team, TeamCreate, TeamUpdate, TeamMember, TeamInvite
-from app.services.firestore_service import (
-    create_document, get_document, get_collection, update_document, 
-    delete_document, get_user_by_email, add_team_member, remove_team_member
+from app.services.async_firestore_service import (
+    create_document, get_document, update_document,
+    get_user_by_email, add_team_member, remove_team_member,
+    get_user_teams as fetch_user_teams, get_documents, get_users_by_emails, batch_write
 )
+from app.services.firestore_service import build_member_ids
+from app.services.storage_service import ArrayUnion, ArrayRemove
+from app.services.team_membership_service import invalidate_team_membership
+from app.services.team_activity_service import last_message_at_updater
 from app.dependencies.auth import get_current_user
+from app.dependencies.teams import require_team_member
+from app.services.websocket_service import manager
 import uuid
 
 router = APIRouter(prefix="/teams", tags=["teams"])
 
 # Helper: Ensure Firestore user exists
-def ensure_user_in_firestore(user: dict):
+async def ensure_user_in_firestore(user: dict):
     """Create a Firestore user document if it does not exist."""
-    user_doc = get_user_by_email(user["email"])
+    user_doc = await get_user_by_email(user["email"])
     if not user_doc:
-        create_document("users", user["uid"], {
+        await create_document("users", user["uid"], {
             "userId": user["uid"],
             "email": user["email"],
             "name": user.get("name", user["email"].split("@")[0]),
             "myTeams": []
         })
-        user_doc = get_user_by_email(user["email"])
+        user_doc = await get_user_by_email(user["email"])
     return user_doc
 
 # -----------------------
@@ -39,18 +46,24 @@ async def create_team(
     admin_email = current_user.get("email")
     admin_id = current_user.get("uid")
     
+    # Look up the admin and every invited email in one read; all writes go in one batch below
+    users_by_email = await get_users_by_emails([admin_email] + list(team_data.member_emails))
+    writes = []
+
     # Get or create admin user info
-    admin_user = get_user_by_email(admin_email)
+    admin_user = users_by_email.get(admin_email)
     if not admin_user:
         # Auto-create user profile if it doesn't exist
         admin_user = {
             "userId": admin_id,
             "name": current_user.get("name", admin_email.split("@")[0]),
             "email": admin_email,
-            "myTeams": [],
+            "myTeams": [team_id],
             "created_at": datetime.utcnow()
         }
-        create_document("users", admin_id, admin_user)
+        writes.append(("set", "users", admin_id, admin_user))
+    else:
+        writes.append(("merge", "users", admin_user["userId"], {"myTeams": ArrayUnion([team_id])}))
     
     # Create team members list starting with admin
     members = [TeamMember(
@@ -62,9 +75,9 @@ async def create_team(
     )]
 
     # Add other members if provided
-    for member_email in team_data.member_emails:
+    for member_email in dict.fromkeys(team_data.member_emails):
         if member_email != admin_email:
-            member_user = get_user_by_email(member_email)
+            member_user = users_by_email.get(member_email)
             if member_user:
                 members.append(TeamMember(
                     user_id=member_user["userId"],
@@ -73,6 +86,7 @@ async def create_team(
                     role="member",
                     joined_at=datetime.utcnow()
                 ))
+                writes.append(("merge", "users", member_user["userId"], {"myTeams": ArrayUnion([team_id])}))
             else:
                 # Create invitation for non-existing users
                 invite_id = str(uuid.uuid4())
@@ -85,7 +99,7 @@ async def create_team(
                     created_at=datetime.utcnow(),
                     expires_at=datetime.utcnow() + timedelta(days=7)
                 )
-                create_document("team_invites", invite_id, invite.dict())
+                writes.append(("set", "team_invites", invite_id, invite.dict()))
 
     # Create the team
     team = Team(
@@ -95,15 +109,11 @@ async def create_team(
         teamName=team_data.teamName,
         description=team_data.description,
         members=members,
+        member_ids=build_member_ids(admin_id, [member.dict() for member in members]),
         created_at=datetime.utcnow()
     )
-    create_document("teams", team_id, team.dict())
-
-    # Update admin user's team list
-    admin_teams = admin_user.get("myTeams", [])
-    if team_id not in admin_teams:
-        admin_teams.append(team_id)
-        update_document("users", admin_id, {"myTeams": admin_teams})
+    writes.append(("set", "teams", team_id, team.dict()))
+    await batch_write(writes)
 
     return team
 
@@ -111,18 +121,12 @@ async def create_team(
 async def get_user_teams(current_user: dict = Depends(get_current_user)):
     """Get all teams for the current user"""
     user_id = current_user.get("uid")
-    teams = get_collection("teams") or []
-    user_teams = [
-        team for team in teams
-        if team.get("admin_id") == user_id or
-           any(member.get("user_id") == user_id for member in team.get("members", []))
-    ]
-    return user_teams
+    return [last_message_at_updater.apply(team) for team in await fetch_user_teams(user_id)]
 
 @router.get("/{team_id}", response_model=Team)
 async def get_team(team_id: str, current_user: dict = Depends(get_current_user)):
     """Get a specific team by ID"""
-    team = get_document("teams", team_id)
+    team = await get_document("teams", team_id)
     if not team:
         raise HTTPException(status_code=404, detail="Team not found")
     
@@ -131,7 +135,7 @@ async def get_team(team_id: str, current_user: dict = Depends(get_current_user))
        not any(member.get("user_id") == user_id for member in team.get("members", [])):
         raise HTTPException(status_code=403, detail="Access denied")
     
-    return team
+    return last_message_at_updater.apply(team)
 
 @router.put("/{team_id}", response_model=Team)
 async def update_team(
@@ -140,7 +144,7 @@ async def update_team(
     current_user: dict = Depends(get_current_user)
 ):
     """Update team information (admin only)"""
-    team = get_document("teams", team_id)
+    team = await get_document("teams", team_id)
     if not team:
         raise HTTPException(status_code=404, detail="Team not found")
     
@@ -150,11 +154,18 @@ async def update_team(
     
     update_data = team_update.dict(exclude_unset=True)
     if update_data:
-        update_document("teams", team_id, update_data)
+        await update_document("teams", team_id, update_data)
+        invalidate_team_membership(team_id)
         team.update(update_data)
     
     return team
 
+@router.get("/{team_id}/presence")
+async def get_team_presence(team_id: str, membership: dict = Depends(require_team_member)):
+    """Members currently connected to the team's chat, on any worker"""
+    online = await manager.online_members(team_id)
+    return {"team_id": team_id, "online": online, "count": len(online)}
+
 # -----------------------
 # Team Members
 # -----------------------
@@ -166,7 +177,7 @@ async def add_member_to_team(
     current_user: dict = Depends(get_current_user)
 ):
     """Add a member to the team by email"""
-    team = get_document("teams", team_id)
+    team = await get_document("teams", team_id)
     if not team:
         raise HTTPException(status_code=404, detail="Team not found")
     
@@ -177,7 +188,7 @@ async def add_member_to_team(
     if any(member.get("email") == member_email for member in team.get("members", [])):
         raise HTTPException(status_code=400, detail="Member already exists")
     
-    member_user = get_user_by_email(member_email)
+    member_user = await get_user_by_email(member_email)
     if not member_user:
         raise HTTPException(status_code=404, detail="User not found")
     
@@ -189,12 +200,12 @@ async def add_member_to_team(
         "joined_at": datetime.utcnow()
     }
     
-    success = add_team_member(team_id, member_data)
+    success = await add_team_member(team_id, member_data)
     if success:
         member_teams = member_user.get("myTeams", [])
         if team_id not in member_teams:
             member_teams.append(team_id)
-            update_document("users", member_user["userId"], {"myTeams": member_teams})
+            await update_document("users", member_user["userId"], {"myTeams": member_teams})
         return {"message": "Member added successfully"}
     
     raise HTTPException(status_code=500, detail="Failed to add member")
@@ -206,7 +217,7 @@ async def remove_member_from_team(
     current_user: dict = Depends(get_current_user)
 ):
     """Remove a member from the team"""
-    team = get_document("teams", team_id)
+    team = await get_document("teams", team_id)
     if not team:
         raise HTTPException(status_code=404, detail="Team not found")
     
@@ -217,14 +228,14 @@ async def remove_member_from_team(
     if member_id == user_id:
         raise HTTPException(status_code=400, detail="Admin cannot remove themselves")
     
-    success = remove_team_member(team_id, member_id)
+    success = await remove_team_member(team_id, member_id)
     if success:
-        member_user = get_document("users", member_id)
+        member_user = await get_document("users", member_id)
         if member_user:
             member_teams = member_user.get("myTeams", [])
             if team_id in member_teams:
                 member_teams.remove(team_id)
-                update_document("users", member_id, {"myTeams": member_teams})
+                await update_document("users", member_id, {"myTeams": member_teams})
         return {"message": "Member removed successfully"}
     
     raise HTTPException(status_code=500, detail="Failed to remove member")
@@ -240,7 +251,7 @@ async def invite_user_to_team(
     current_user: dict = Depends(get_current_user)
 ):
     """Invite a user to join the team"""
-    team = get_document("teams", team_id)
+    team = await get_document("teams", team_id)
     if not team:
         raise HTTPException(status_code=404, detail="Team not found")
     
@@ -262,7 +273,7 @@ async def invite_user_to_team(
         expires_at=datetime.utcnow() + timedelta(days=7)
     )
     
-    create_document("team_invites", invite_id, invite.dict())
+    await create_document("team_invites", invite_id, invite.dict())
     return {"message": "Invitation sent successfully", "invite_id": invite_id}
 
 # -----------------------
@@ -272,7 +283,7 @@ async def invite_user_to_team(
 @router.delete("/{team_id}")
 async def delete_team(team_id: str, current_user: dict = Depends(get_current_user)):
     """Delete a team (admin only)"""
-    team = get_document("teams", team_id)
+    team = await get_document("teams", team_id)
     if not team:
         raise HTTPException(status_code=404, detail="Team not found")
     
@@ -280,14 +291,15 @@ async def delete_team(team_id: str, current_user: dict = Depends(get_current_use
     if team.get("admin_id") != user_id:
         raise HTTPException(status_code=403, detail="Only team admin can delete team")
     
-    # Remove team from all members' myTeams
-    for member in team.get("members", []):
-        member_user = get_document("users", member["user_id"])
-        if member_user:
-            member_teams = member_user.get("myTeams", [])
-            if team_id in member_teams:
-                member_teams.remove(team_id)
-                update_document("users", member["user_id"], {"myTeams": member_teams})
-    
-    delete_document("teams", team_id)
+    # Remove team from all members' myTeams and delete the team in a single batch
+    member_ids = [member["user_id"] for member in team.get("members", [])]
+    member_users = await get_documents("users", member_ids)
+    writes = [
+        ("update", "users", member_id, {"myTeams": ArrayRemove([team_id])})
+        for member_id, member_user in member_users.items()
+        if team_id in member_user.get("myTeams", [])
+    ]
+    writes.append(("delete", "teams", team_id, None))
+    await batch_write(writes)
+    invalidate_team_membership(team_id)
     return {"message": "Team deleted successfully"}
@@ -1,12 +1,16 @@
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import APIRouter, HTTPException, Depends, Query, status
 from datetime import datetime
-from typing import List
-from app.models.todo import Todo, TodoCreate, TodoResponse, AssignedUser
-from app.services.firestore_service import (
-    create_todo, get_todo, get_team_todos, get_user_todos,
-    delete_todo, get_user_by_email, get_document
+from typing import List, Optional
+from app.models.todo import (
+    Todo, TodoCreate, TodoUpdate, TodoResponse, AssignedUser, TodoStatus, TodoPriority
+)
+from app.services.async_firestore_service import (
+    create_todo, get_todo, get_team_todos, get_user_todos, update_todo,
+    delete_todo, get_user_by_email
 )
 from app.dependencies.auth import get_current_user
+from app.dependencies.teams import ensure_team_member, require_team_member
+from app.services.team_membership_service import get_team_membership
 import uuid
 
 router = APIRouter(prefix="/todos", tags=["todos"])
@@ -22,7 +26,7 @@ async def create_new_todo(
     creator_id = current_user.get("uid")
     
     # Get creator info
-    creator_user = get_user_by_email(creator_email)
+    creator_user = await get_user_by_email(creator_email)
     if not creator_user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -30,7 +34,7 @@ async def create_new_todo(
         )
     
     # Verify team exists
-    team = get_document("teams", todo_data.team_id)
+    team = await get_team_membership(todo_data.team_id)
     if not team:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -40,7 +44,7 @@ async def create_new_todo(
     # Build assigned users list
     assigned_users = []
     for email in todo_data.assigned_user_emails:
-        user = get_user_by_email(email)
+        user = await get_user_by_email(email)
         if user:
             assigned_users.append({
                 "user_id": user["userId"],
@@ -68,7 +72,7 @@ async def create_new_todo(
         "completed_at": None
     }
     
-    create_todo(todo_id, todo_doc)
+    await create_todo(todo_id, todo_doc)
     
     # Convert back to response model with proper datetime objects
     assigned_users_response = [
@@ -101,31 +105,10 @@ async def create_new_todo(
 @router.get("/team/{team_id}", response_model=List[TodoResponse])
 async def get_todos_by_team(
     team_id: str,
-    current_user: dict = Depends(get_current_user)
+    membership: dict = Depends(require_team_member)
 ):
     """Get all todos for a specific team"""
-    # Verify team exists and user has access
-    team = get_document("teams", team_id)
-    if not team:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Team not found"
-        )
-    
-    user_id = current_user.get("uid")
-    # Check if user is admin or member
-    is_member = (
-        team.get("admin_id") == user_id or
-        any(member.get("user_id") == user_id for member in team.get("members", []))
-    )
-    
-    if not is_member:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="You don't have access to this team"
-        )
-    
-    todos = get_team_todos(team_id)
+    todos = await get_team_todos(team_id)
     
     # Convert to response models
     result = []
@@ -161,11 +144,19 @@ async def get_todos_by_team(
 
 @router.get("/my-todos", response_model=List[TodoResponse])
 async def get_my_todos(
+    status_filter: Optional[TodoStatus] = Query(None, alias="status"),
+    priority: Optional[TodoPriority] = None,
+    deadline_before: Optional[datetime] = None,
     current_user: dict = Depends(get_current_user)
 ):
-    """Get all todos assigned to the current user"""
+    """Get all todos assigned to the current user, optionally filtered by status, priority or deadline"""
     user_email = current_user.get("email")
-    todos = get_user_todos(user_email)
+    todos = await get_user_todos(
+        user_email,
+        status=status_filter.value if status_filter else None,
+        priority=priority.value if priority else None,
+        deadline_before=deadline_before.isoformat() if deadline_before else None
+    )
     
     # Convert to response models
     result = []
@@ -205,7 +196,7 @@ async def get_todo_by_id(
     current_user: dict = Depends(get_current_user)
 ):
     """Get a specific todo by ID"""
-    todo = get_todo(todo_id)
+    todo = await get_todo(todo_id)
     if not todo:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -213,25 +204,87 @@ async def get_todo_by_id(
         )
     
     # Verify user has access to the team
-    team = get_document("teams", todo["team_id"])
-    if not team:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Team not found"
+    await ensure_team_member(todo["team_id"], current_user.get("uid"), "You don't have access to this todo")
+    
+    assigned_users = [
+        AssignedUser(
+            user_id=user["user_id"],
+            email=user["email"],
+            name=user["name"],
+            assigned_at=datetime.fromisoformat(user["assigned_at"])
         )
+        for user in todo.get("assigned_users", [])
+    ]
     
-    user_id = current_user.get("uid")
-    is_member = (
-        team.get("admin_id") == user_id or
-        any(member.get("user_id") == user_id for member in team.get("members", []))
+    return TodoResponse(
+        todo_id=todo["todo_id"],
+        team_id=todo["team_id"],
+        title=todo["title"],
+        description=todo.get("description"),
+        deadline=datetime.fromisoformat(todo["deadline"]) if todo.get("deadline") else None,
+        priority=todo["priority"],
+        status=todo["status"],
+        created_by=todo["created_by"],
+        creator_email=todo["creator_email"],
+        creator_name=todo["creator_name"],
+        assigned_users=assigned_users,
+        created_at=datetime.fromisoformat(todo["created_at"]),
+        updated_at=datetime.fromisoformat(todo["updated_at"]) if todo.get("updated_at") else None,
+        completed_at=datetime.fromisoformat(todo["completed_at"]) if todo.get("completed_at") else None
     )
-    
-    if not is_member:
+
+@router.put("/{todo_id}", response_model=TodoResponse)
+async def update_todo_by_id(
+    todo_id: str,
+    todo_update: TodoUpdate,
+    current_user: dict = Depends(get_current_user)
+):
+    """Update a todo (any team member)"""
+    todo = await get_todo(todo_id)
+    if not todo:
         raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="You don't have access to this todo"
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Todo not found"
         )
     
+    await ensure_team_member(todo["team_id"], current_user.get("uid"), "You don't have access to this todo")
+    
+    update_data = todo_update.dict(exclude_unset=True)
+    assigned_user_emails = update_data.pop("assigned_user_emails", None)
+    
+    if "deadline" in update_data:
+        update_data["deadline"] = update_data["deadline"].isoformat() if update_data["deadline"] else None
+    if update_data.get("priority"):
+        update_data["priority"] = update_data["priority"].value
+    if update_data.get("status"):
+        update_data["status"] = update_data["status"].value
+        if update_data["status"] == TodoStatus.COMPLETED.value and not todo.get("completed_at"):
+            update_data["completed_at"] = datetime.utcnow().isoformat()
+        elif update_data["status"] != TodoStatus.COMPLETED.value:
+            update_data["completed_at"] = None
+    
+    if assigned_user_emails is not None:
+        # Keep the original assignment time for users that stay assigned
+        existing = {user["email"]: user for user in todo.get("assigned_users", [])}
+        assigned_users = []
+        for email in assigned_user_emails:
+            if email in existing:
+                assigned_users.append(existing[email])
+                continue
+            user = await get_user_by_email(email)
+            if user:
+                assigned_users.append({
+                    "user_id": user["userId"],
+                    "email": email,
+                    "name": user.get("name", email.split("@")[0]),
+                    "assigned_at": datetime.utcnow().isoformat()
+                })
+        update_data["assigned_users"] = assigned_users
+    
+    if update_data:
+        await update_todo(todo_id, update_data)
+        todo.update(update_data)
+    
     assigned_users = [
         AssignedUser(
             user_id=user["user_id"],
@@ -265,7 +318,7 @@ async def delete_todo_by_id(
     current_user: dict = Depends(get_current_user)
 ):
     """Delete a todo"""
-    todo = get_todo(todo_id)
+    todo = await get_todo(todo_id)
     if not todo:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -273,7 +326,7 @@ async def delete_todo_by_id(
         )
     
     # Verify user is creator or team admin
-    team = get_document("teams", todo["team_id"])
+    team = await get_team_membership(todo["team_id"])
     if not team:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -282,7 +335,7 @@ async def delete_todo_by_id(
     
     user_id = current_user.get("uid")
     is_creator = todo["created_by"] == user_id
-    is_admin = team.get("admin_id") == user_id
+    is_admin = team["admin_id"] == user_id
     
     if not (is_creator or is_admin):
         raise HTTPException(
@@ -290,5 +343,5 @@ async def delete_todo_by_id(
             detail="Only the creator or team admin can delete this todo"
         )
     
-    delete_todo(todo_id)
+    await delete_todo(todo_id)
     return None
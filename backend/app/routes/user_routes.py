@@ -2,10 +2,11 @@ from fastapi import APIRouter, HTTPException, Depends, status
 from datetime import datetime
 from typing import List, Optional
 from app.models.users import User, UserCreate, UserUpdate, UserProfile
-from app.services.firestore_service import (
+from app.services.async_firestore_service import (
     create_document, get_document, get_collection, update_document,
     get_user_by_email, get_user_teams
 )
+from app.services.team_activity_service import last_message_at_updater
 from app.dependencies.auth import get_current_user
 import uuid
 
@@ -14,7 +15,7 @@ router = APIRouter(prefix="/users", tags=["users"])
 async def _create_user_internal(user_data: UserCreate):
     """Internal function to create a user (to avoid circular imports)"""
     # Check if user already exists
-    existing_user = get_user_by_email(user_data.email)
+    existing_user = await get_user_by_email(user_data.email)
     if existing_user:
         raise HTTPException(status_code=400, detail="User with this email already exists")
     
@@ -27,7 +28,7 @@ async def _create_user_internal(user_data: UserCreate):
         created_at=datetime.utcnow()
     )
     
-    create_document("users", user_id, user.dict())
+    await create_document("users", user_id, user.dict())
     return user
 
 @router.post("/", response_model=User)
@@ -42,10 +43,10 @@ async def get_current_user_profile(current_user: dict = Depends(get_current_user
     user_email = current_user.get("email")
     
     # Try to get user from our database first
-    user = get_document("users", user_id)
+    user = await get_document("users", user_id)
     if not user:
         # If not found, try to get by email
-        user = get_user_by_email(user_email)
+        user = await get_user_by_email(user_email)
         if not user:
             # Create user profile from Firebase auth data
             user_data = UserCreate(
@@ -65,7 +66,7 @@ async def get_current_user_profile(current_user: dict = Depends(get_current_user
 @router.get("/{user_id}", response_model=User)
 async def get_user(user_id: str, current_user: dict = Depends(get_current_user)):
     """Get a user by ID"""
-    user = get_document("users", user_id)
+    user = await get_document("users", user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
@@ -78,14 +79,14 @@ async def update_current_user(
 ):
     """Update current user's profile"""
     user_id = current_user.get("uid")
-    user = get_document("users", user_id)
+    user = await get_document("users", user_id)
     
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
     update_data = user_update.dict(exclude_unset=True)
     if update_data:
-        update_document("users", user_id, update_data)
+        await update_document("users", user_id, update_data)
         user.update(update_data)
     
     return user
@@ -94,23 +95,23 @@ async def update_current_user(
 async def get_current_user_teams(current_user: dict = Depends(get_current_user)):
     """Get all teams for the current user"""
     user_id = current_user.get("uid")
-    teams = get_user_teams(user_id)
-    return teams
+    teams = await get_user_teams(user_id)
+    return [last_message_at_updater.apply(team) for team in teams]
 
 @router.get("/{user_id}/teams")
 async def get_specific_user_teams(user_id: str, current_user: dict = Depends(get_current_user)):
     """Get all teams for a specific user"""
-    user = get_document("users", user_id)
+    user = await get_document("users", user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    teams = get_user_teams(user_id)
-    return teams
+    teams = await get_user_teams(user_id)
+    return [last_message_at_updater.apply(team) for team in teams]
 
 @router.get("/search/{email}")
 async def search_user_by_email(email: str, current_user: dict = Depends(get_current_user)):
     """Search for a user by email address"""
-    user = get_user_by_email(email)
+    user = await get_user_by_email(email)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
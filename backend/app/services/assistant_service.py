@@ -5,8 +5,10 @@ import os
 import uuid
 from dotenv import load_dotenv
 from app.services.vector_db_service import search_relevant_context, add_messages_batch
-from app.services.firestore_service import get_team_messages
-from app.config import db
+from app.services.message_buffer_service import message_buffer
+from app.services.storage_service import get_storage, ArrayUnion
+from app.services.async_firestore_service import run_in_executor
+from fastapi.concurrency import run_in_threadpool
 
 # Load environment variables
 load_dotenv()
@@ -31,15 +33,17 @@ class AssistantService:
         """Generate a unique key for conversation history"""
         return f"{user_id}:{project_id or 'general'}"
     
-    def get_conversation_history(self, user_id: str, project_id: Optional[str] = None) -> List[Dict[str, str]]:
+    async def get_conversation_history(self, user_id: str, project_id: Optional[str] = None) -> List[Dict[str, str]]:
         """Get conversation history for a user in a specific project"""
         history_key = self._get_history_key(user_id, project_id)
         if history_key not in self.conversation_history:
             # Try to load from Firestore
-            self.conversation_history[history_key] = self._load_history_from_firestore(user_id, project_id)
+            self.conversation_history[history_key] = await run_in_executor(
+                self._load_history_from_firestore, user_id, project_id
+            )
         return self.conversation_history[history_key]
     
-    def add_to_history(self, user_id: str, role: str, content: str, project_id: Optional[str] = None):
+    async def add_to_history(self, user_id: str, role: str, content: str, project_id: Optional[str] = None):
         """Add a message to conversation history and persist to Firestore"""
         history_key = self._get_history_key(user_id, project_id)
         if history_key not in self.conversation_history:
@@ -58,16 +62,16 @@ class AssistantService:
             self.conversation_history[history_key] = self.conversation_history[history_key][-20:]
         
         # Persist to Firestore
-        self._save_message_to_firestore(user_id, project_id, message_data)
+        await run_in_executor(self._save_message_to_firestore, user_id, project_id, message_data)
     
-    def clear_history(self, user_id: str, project_id: Optional[str] = None):
+    async def clear_history(self, user_id: str, project_id: Optional[str] = None):
         """Clear conversation history for a user in a specific project"""
         history_key = self._get_history_key(user_id, project_id)
         if history_key in self.conversation_history:
             self.conversation_history[history_key] = []
         
         # Clear from Firestore
-        self._clear_history_from_firestore(user_id, project_id)
+        await run_in_executor(self._clear_history_from_firestore, user_id, project_id)
     
     async def generate_response(
         self,
@@ -96,7 +100,7 @@ class AssistantService:
             model = genai.GenerativeModel('gemini-2.0-flash')
             
             # Get conversation history for this specific project
-            history = self.get_conversation_history(user_id, project_context)
+            history = await self.get_conversation_history(user_id, project_context)
             
             # Retrieve relevant context from vector DB if RAG is enabled
             context_messages = []
@@ -107,12 +111,14 @@ class AssistantService:
             if use_rag:
                 team_messages = []
                 if project_context:
-                    team_messages = get_team_messages(project_context)
+                    team_messages = await message_buffer.get_recent_messages(project_context)
 
                 # Search for relevant messages from the team (or all teams if no context)
                 # This searches ALL users' messages in the team, not just current user
+                # (off the event loop: the query embedding waits for a shared inference batch)
                 print(f"🔍 Searching vector DB for: '{message}' in team: {project_context}")
-                context_messages = search_relevant_context(
+                context_messages = await run_in_threadpool(
+                    search_relevant_context,
                     query=message,
                     team_id=project_context,  # If None, searches across all teams
                     n_results=10  # Increased to get more context from all users
@@ -235,8 +241,8 @@ class AssistantService:
             assistant_response = response.text.strip()
             
             # Add to conversation history for this specific project
-            self.add_to_history(user_id, "user", message, project_context)
-            self.add_to_history(user_id, "assistant", assistant_response, project_context)
+            await self.add_to_history(user_id, "user", message, project_context)
+            await self.add_to_history(user_id, "assistant", assistant_response, project_context)
             
             return {
                 "response": assistant_response,
@@ -316,15 +322,14 @@ Description: {description}
     def _load_history_from_firestore(self, user_id: str, project_id: Optional[str] = None) -> List[Dict[str, str]]:
         """Load conversation history from Firestore"""
         try:
-            if db is None:
+            storage = get_storage()
+            if not storage.available:
                 return []
             
             project_key = project_id or "general"
-            history_ref = db.collection("thinkbuddy_chats").document(f"{user_id}_{project_key}")
-            doc = history_ref.get()
+            data = storage.get("thinkbuddy_chats", f"{user_id}_{project_key}")
             
-            if doc.exists:
-                data = doc.to_dict()
+            if data:
                 return data.get("messages", [])
             return []
         except Exception as e:
@@ -334,26 +339,26 @@ Description: {description}
     def _save_message_to_firestore(self, user_id: str, project_id: Optional[str], message_data: Dict[str, str]):
         """Save a single message to Firestore"""
         try:
-            if db is None:
+            storage = get_storage()
+            if not storage.available:
                 return
             
             project_key = project_id or "general"
             doc_id = f"{user_id}_{project_key}"
-            history_ref = db.collection("thinkbuddy_chats").document(doc_id)
             
             # Get existing document
-            doc = history_ref.get()
+            doc = storage.get("thinkbuddy_chats", doc_id)
             
-            if doc.exists:
+            if doc:
                 # Append to existing messages
-                history_ref.update({
-                    "messages": db.field_value.ArrayUnion([message_data]),
+                storage.update("thinkbuddy_chats", doc_id, {
+                    "messages": ArrayUnion([message_data]),
                     "updated_at": datetime.now().isoformat(),
                     "last_message_at": datetime.now().isoformat()
                 })
             else:
                 # Create new document
-                history_ref.set({
+                storage.set("thinkbuddy_chats", doc_id, {
                     "user_id": user_id,
                     "project_id": project_key,
                     "messages": [message_data],
@@ -367,34 +372,37 @@ Description: {description}
     def _clear_history_from_firestore(self, user_id: str, project_id: Optional[str] = None):
         """Clear conversation history from Firestore"""
         try:
-            if db is None:
+            storage = get_storage()
+            if not storage.available:
                 return
             
             project_key = project_id or "general"
             doc_id = f"{user_id}_{project_key}"
-            history_ref = db.collection("thinkbuddy_chats").document(doc_id)
             
             # Update to empty messages array
-            history_ref.update({
+            storage.update("thinkbuddy_chats", doc_id, {
                 "messages": [],
                 "updated_at": datetime.now().isoformat()
             })
         except Exception as e:
             print(f"Error clearing history from Firestore: {str(e)}")
     
-    def get_all_project_chats(self, user_id: str) -> List[Dict[str, Any]]:
+    async def get_all_project_chats(self, user_id: str) -> List[Dict[str, Any]]:
         """Get all ThinkBuddy chat sessions for a user across all projects"""
+        return await run_in_executor(self._get_project_chats_from_firestore, user_id)
+
+    def _get_project_chats_from_firestore(self, user_id: str) -> List[Dict[str, Any]]:
+        """Query all ThinkBuddy chat sessions of a user from Firestore"""
         try:
-            if db is None:
+            storage = get_storage()
+            if not storage.available:
                 return []
             
             # Query all chats for this user
-            chats_ref = db.collection("thinkbuddy_chats").where("user_id", "==", user_id)
-            docs = chats_ref.stream()
+            docs = storage.query("thinkbuddy_chats", filters=[("user_id", "==", user_id)])
             
             chats = []
-            for doc in docs:
-                data = doc.to_dict()
+            for data in docs:
                 chats.append({
                     "project_id": data.get("project_id"),
                     "message_count": len(data.get("messages", [])),
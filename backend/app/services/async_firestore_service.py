@@ -0,0 +1,137 @@
+"""
+Async variants of the helpers in firestore_service.
+
+The Firestore Admin SDK is synchronous, so every call is dispatched to a
+bounded thread pool instead of running on the event loop. Route handlers and
+the WebSocket endpoint should import from this module and ``await`` the calls.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import List, Dict, Any, Optional, Tuple
+from app.config import FIRESTORE_MAX_WORKERS
+from app.services import firestore_service
+
+_executor = ThreadPoolExecutor(
+    max_workers=FIRESTORE_MAX_WORKERS,
+    thread_name_prefix="firestore"
+)
+
+async def run_in_executor(func, *args, **kwargs):
+    """Run a blocking Firestore call on the shared thread pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, partial(func, *args, **kwargs))
+
+def shutdown_executor():
+    """Stop accepting new work and wait for in-flight Firestore calls"""
+    _executor.shutdown(wait=True)
+
+async def create_document(collection_name: str, doc_id: str, data: dict):
+    """Create a new document in Firestore"""
+    return await run_in_executor(firestore_service.create_document, collection_name, doc_id, data)
+
+async def get_document(collection_name: str, doc_id: str) -> Optional[Dict[str, Any]]:
+    """Get a single document from Firestore"""
+    return await run_in_executor(firestore_service.get_document, collection_name, doc_id)
+
+async def get_collection(collection_name: str) -> List[Dict[str, Any]]:
+    """Get all documents from a collection"""
+    return await run_in_executor(firestore_service.get_collection, collection_name)
+
+async def update_document(collection_name: str, doc_id: str, data: dict):
+    """Update a document in Firestore"""
+    return await run_in_executor(firestore_service.update_document, collection_name, doc_id, data)
+
+async def delete_document(collection_name: str, doc_id: str):
+    """Delete a document from Firestore"""
+    return await run_in_executor(firestore_service.delete_document, collection_name, doc_id)
+
+async def query_collection(collection_name: str, field: str, operator: str, value: Any) -> List[Dict[str, Any]]:
+    """Query a collection with a specific condition"""
+    return await run_in_executor(firestore_service.query_collection, collection_name, field, operator, value)
+
+async def get_documents(collection_name: str, doc_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Get several documents in one round-trip, keyed by document ID"""
+    return await run_in_executor(firestore_service.get_documents, collection_name, doc_ids)
+
+async def batch_write(operations: List[Tuple[str, str, str, Optional[Dict[str, Any]]]]):
+    """Apply several writes atomically in one round-trip"""
+    return await run_in_executor(firestore_service.batch_write, operations)
+
+async def advance_field(collection_name: str, field: str, values: Dict[str, Any]) -> List[str]:
+    """Set a field per document only where it moves forward; returns the ids of missing documents"""
+    return await run_in_executor(firestore_service.advance_field, collection_name, field, values)
+
+async def get_user_by_email(email: str) -> Optional[Dict[str, Any]]:
+    """Get user by email address from Firestore"""
+    return await run_in_executor(firestore_service.get_user_by_email, email)
+
+async def get_users_by_emails(emails: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Get users for several email addresses, keyed by email"""
+    return await run_in_executor(firestore_service.get_users_by_emails, emails)
+
+async def get_team_messages(team_id: str, limit: int = 50) -> List[Dict[str, Any]]:
+    """Get messages for a specific team, ordered by creation time"""
+    return await run_in_executor(firestore_service.get_team_messages, team_id, limit)
+
+async def get_team_messages_page(
+    team_id: str,
+    limit: int = 50,
+    before: Optional[str] = None,
+    after: Optional[str] = None
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Get one page of a team's messages plus the cursor for the next page"""
+    return await run_in_executor(firestore_service.get_team_messages_page, team_id, limit, before, after)
+
+async def query_team_messages_page(
+    team_id: str,
+    limit: int = 50,
+    before: Optional[str] = None,
+    after: Optional[str] = None
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Get one page of a team's messages, raising on storage errors"""
+    return await run_in_executor(firestore_service.query_team_messages_page, team_id, limit, before, after)
+
+async def get_user_teams(user_id: str) -> List[Dict[str, Any]]:
+    """Get all teams a user is a member of"""
+    return await run_in_executor(firestore_service.get_user_teams, user_id)
+
+async def add_team_member(team_id: str, member_data: Dict[str, Any]):
+    """Add a member to a team"""
+    return await run_in_executor(firestore_service.add_team_member, team_id, member_data)
+
+async def remove_team_member(team_id: str, user_id: str):
+    """Remove a member from a team"""
+    return await run_in_executor(firestore_service.remove_team_member, team_id, user_id)
+
+# Todo-related functions
+async def create_todo(todo_id: str, todo_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Create a new todo in Firestore"""
+    return await run_in_executor(firestore_service.create_todo, todo_id, todo_data)
+
+async def update_todo(todo_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    """Update a todo, keeping the assignee index in sync with assigned_users"""
+    return await run_in_executor(firestore_service.update_todo, todo_id, data)
+
+async def get_todo(todo_id: str) -> Optional[Dict[str, Any]]:
+    """Get a single todo by ID"""
+    return await run_in_executor(firestore_service.get_todo, todo_id)
+
+async def get_team_todos(team_id: str) -> List[Dict[str, Any]]:
+    """Get all todos for a specific team"""
+    return await run_in_executor(firestore_service.get_team_todos, team_id)
+
+async def get_user_todos(
+    user_email: str,
+    status: Optional[str] = None,
+    priority: Optional[str] = None,
+    deadline_before: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """Get all todos assigned to a specific user, optionally filtered server-side"""
+    return await run_in_executor(
+        firestore_service.get_user_todos, user_email, status, priority, deadline_before
+    )
+
+async def delete_todo(todo_id: str) -> bool:
+    """Delete a todo from Firestore"""
+    return await run_in_executor(firestore_service.delete_todo, todo_id)
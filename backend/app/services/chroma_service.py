@@ -1,28 +1,16 @@
-import chromadb
-from chromadb.config import Settings
-from chromadb.utils import embedding_functions
 import os
 from typing import List, Dict, Any
 from datetime import datetime
+from app.services.vector_db_service import get_chroma_client
+from app.services.embedding_service import embedding_service
 
 class ChromaDBService:
     """Service for managing ChromaDB vector database operations"""
     
     def __init__(self):
         """Initialize ChromaDB client and collections"""
-        # Create persistent client
-        self.client = chromadb.PersistentClient(
-            path="./chroma_db",
-            settings=Settings(
-                anonymized_telemetry=False,
-                allow_reset=True
-            )
-        )
-        
-        # Use sentence transformers for embeddings
-        self.embedding_function = embedding_functions.SentenceTransformerEmbeddingFunction(
-            model_name="all-MiniLM-L6-v2"
-        )
+        # Shared persistent client (same store as the team message index)
+        self.client = get_chroma_client()
         
         # Initialize collections
         self.conversations_collection = self._get_or_create_collection("conversations")
@@ -34,7 +22,8 @@ class ChromaDBService:
         try:
             return self.client.get_or_create_collection(
                 name=name,
-                embedding_function=self.embedding_function,
+                # Embeddings are computed by the shared embedding_service
+                embedding_function=None,
                 metadata={"hnsw:space": "cosine"}
             )
         except Exception as e:
@@ -51,6 +40,7 @@ class ChromaDBService:
         try:
             self.conversations_collection.add(
                 documents=[content],
+                embeddings=embedding_service.embed_documents([content]),
                 ids=[conversation_id],
                 metadatas=[{
                     **metadata,
@@ -73,6 +63,7 @@ class ChromaDBService:
         try:
             self.projects_collection.add(
                 documents=[content],
+                embeddings=embedding_service.embed_documents([content]),
                 ids=[project_id],
                 metadatas=[{
                     **metadata,
@@ -95,6 +86,7 @@ class ChromaDBService:
         try:
             self.code_snippets_collection.add(
                 documents=[code],
+                embeddings=embedding_service.embed_documents([code]),
                 ids=[snippet_id],
                 metadatas=[{
                     **metadata,
@@ -116,7 +108,7 @@ class ChromaDBService:
         """Search for relevant conversations"""
         try:
             results = self.conversations_collection.query(
-                query_texts=[query],
+                query_embeddings=[embedding_service.embed_query(query)],
                 n_results=n_results,
                 where=where
             )
@@ -134,7 +126,7 @@ class ChromaDBService:
         """Search for relevant project contexts"""
         try:
             results = self.projects_collection.query(
-                query_texts=[query],
+                query_embeddings=[embedding_service.embed_query(query)],
                 n_results=n_results,
                 where=where
             )
@@ -152,7 +144,7 @@ class ChromaDBService:
         """Search for relevant code snippets"""
         try:
             results = self.code_snippets_collection.query(
-                query_texts=[query],
+                query_embeddings=[embedding_service.embed_query(query)],
                 n_results=n_results,
                 where=where
             )
@@ -207,9 +199,11 @@ class ChromaDBService:
             return False
     
     def reset_database(self) -> bool:
-        """Reset all collections (use with caution)"""
+        """Reset this service's collections (use with caution)"""
         try:
-            self.client.reset()
+            # Not client.reset(): the store is shared with the team message index
+            for name in ("conversations", "projects", "code_snippets"):
+                self.client.delete_collection(name)
             # Reinitialize collections
             self.conversations_collection = self._get_or_create_collection("conversations")
             self.projects_collection = self._get_or_create_collection("projects")
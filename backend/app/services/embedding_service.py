@@ -0,0 +1,175 @@
+"""
+Shared text embedding model with micro-batching.
+
+Both vector modules embed through the single `embedding_service` instance instead of letting
+each Chroma collection load its own model. embed() blocks until its batch has run, so callers
+must stay off the event loop: the assistant searches via run_in_threadpool and the indexer
+on its own executor. Requests arriving within EMBEDDING_BATCH_WAIT of each other are
+concatenated and run as one forward pass, so concurrent assistant queries and indexing
+batches share inference instead of each paying for a tiny one. Query embeddings
+are additionally cached by normalized text, since users ask the same questions repeatedly,
+and document embeddings by content hash, so duplicate texts are embedded once.
+"""
+import hashlib
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Sequence, Tuple
+from app.config import (
+    EMBEDDING_BACKEND, EMBEDDING_MODEL, EMBEDDING_BATCH_SIZE, EMBEDDING_BATCH_WAIT, EMBEDDING_THREADS,
+    QUERY_EMBEDDING_CACHE_SIZE, QUERY_EMBEDDING_CACHE_TTL, DOCUMENT_EMBEDDING_CACHE_SIZE
+)
+from app.services.cache_service import TTLCache
+from app.services.metrics_service import register_provider
+
+Embedding = Sequence[float]
+
+class EmbeddingService:
+    """Runs embedding requests in batches on a fixed pool of inference threads"""
+
+    def __init__(
+        self,
+        backend: str = EMBEDDING_BACKEND,
+        model_name: str = EMBEDDING_MODEL,
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+        batch_wait: float = EMBEDDING_BATCH_WAIT,
+        threads: int = EMBEDDING_THREADS
+    ):
+        self.backend = backend
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.threads = max(threads, 1)
+        self._requests: "queue.Queue[Tuple[List[str], Future]]" = queue.Queue()
+        self._model = None
+        self._lock = threading.Lock()
+        self._workers: List[threading.Thread] = []
+        self.query_cache = TTLCache(max_size=QUERY_EMBEDDING_CACHE_SIZE, ttl_seconds=QUERY_EMBEDDING_CACHE_TTL)
+        # Keyed by (model, sha256 of the exact text); entries never expire, only the LRU bound applies
+        self.document_cache = TTLCache(max_size=DOCUMENT_EMBEDDING_CACHE_SIZE, ttl_seconds=None)
+        self.requests = 0
+        self.texts = 0
+        self.batches = 0
+        self.max_batch = 0
+        self.inference_seconds = 0.0
+
+    @property
+    def model_id(self) -> str:
+        """Identifies the vectors this service produces (backend and model)"""
+        if self.backend == "onnx":
+            return "onnx:all-MiniLM-L6-v2"
+        return f"{self.backend}:{self.model_name}"
+
+    def _load_model(self):
+        from chromadb.utils import embedding_functions
+        if self.backend == "onnx":
+            return embedding_functions.ONNXMiniLM_L6_V2()
+        if self.backend == "sentence-transformers":
+            return embedding_functions.SentenceTransformerEmbeddingFunction(model_name=self.model_name)
+        raise ValueError(f"Unknown embedding backend: {self.backend}")
+
+    def _start(self):
+        with self._lock:
+            if self._workers:
+                return
+            self._model = self._load_model()
+            for i in range(self.threads):
+                worker = threading.Thread(target=self._work, name=f"embedding-{i}", daemon=True)
+                worker.start()
+                self._workers.append(worker)
+
+    def embed(self, texts: Sequence[str]) -> List[Embedding]:
+        """Embed texts, blocking until the batch they were grouped into has run"""
+        if not texts:
+            return []
+        if not self._workers:
+            self._start()
+        future: Future = Future()
+        self._requests.put((list(texts), future))
+        return future.result()
+
+    def embed_query(self, query: str) -> Embedding:
+        """Embed a search query, reusing the vector of an earlier identical (normalized) query"""
+        # Runs of whitespace never change the tokens; case only doesn't for the uncased ONNX MiniLM
+        # (whose tokenizer lowercases), while a configured sentence-transformers model may be cased
+        normalized = " ".join(query.split())
+        if self.backend == "onnx":
+            normalized = normalized.lower()
+        key = (self.model_id, normalized)
+        embedding = self.query_cache.get(key)
+        if embedding is None:
+            embedding = self.embed([query])[0]
+            self.query_cache.set(key, embedding)
+        return embedding
+
+    def embed_documents(self, texts: Sequence[str]) -> List[Embedding]:
+        """Embed documents, reusing the vectors of texts already embedded (matched by content hash)"""
+        keys = [(self.model_id, hashlib.sha256(text.encode("utf-8")).digest()) for text in texts]
+        vectors = [self.document_cache.get(key) for key in keys]
+        # Each distinct missing text is embedded once, even if repeated within the batch
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+        if missing:
+            computed = dict(zip(missing, self.embed(missing)))
+            for i, text in enumerate(texts):
+                if vectors[i] is None:
+                    vectors[i] = computed[text]
+                    self.document_cache.set(keys[i], vectors[i])
+        return vectors
+
+    def _collect(self) -> List[Tuple[List[str], Future]]:
+        """Wait for a request, then gather more until the batch is full or the wait elapses"""
+        batch = [self._requests.get()]
+        size = len(batch[0][0])
+        deadline = time.monotonic() + self.batch_wait
+        while size < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(request)
+            size += len(request[0])
+        return batch
+
+    def _work(self):
+        while True:
+            batch = self._collect()
+            texts = [text for request_texts, _ in batch for text in request_texts]
+            started = time.monotonic()
+            try:
+                vectors = self._model(texts)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            with self._lock:
+                self.requests += len(batch)
+                self.texts += len(texts)
+                self.batches += 1
+                self.max_batch = max(self.max_batch, len(texts))
+                self.inference_seconds += time.monotonic() - started
+            offset = 0
+            for request_texts, future in batch:
+                future.set_result(list(vectors[offset:offset + len(request_texts)]))
+                offset += len(request_texts)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "model": self.model_id,
+            "loaded": self._model is not None,
+            "requests": self.requests,
+            "texts": self.texts,
+            "batches": self.batches,
+            "avg_batch": round(self.texts / self.batches, 2) if self.batches else 0.0,
+            "max_batch": self.max_batch,
+            "inference_seconds": round(self.inference_seconds, 3),
+            "queued": self._requests.qsize()
+        }
+
+embedding_service = EmbeddingService()
+register_provider("embeddings", embedding_service.stats)
+register_provider("query_embedding_cache", embedding_service.query_cache.stats)
+register_provider("document_embedding_cache", embedding_service.document_cache.stats)
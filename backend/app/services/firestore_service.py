@@ -1,54 +1,58 @@
-from app.config import db
-from typing import List, Dict, Any, Optional
-from datetime import datetime
+from app.services.storage_service import (
+    get_storage, MissingIndexError, ASCENDING, DESCENDING, WriteOperation
+)
+from app.services.team_membership_service import invalidate_team_membership
+from app.services import metrics_service
+from typing import List, Dict, Any, Optional, Tuple
+from datetime import datetime, timezone
+import base64
+import json
 
 def create_document(collection_name: str, doc_id: str, data: dict):
     """Create a new document in Firestore"""
-    if db is None:
-        raise Exception("Firestore not configured")
-    db.collection(collection_name).document(doc_id).set(data)
+    get_storage().set(collection_name, doc_id, data)
     return data
 
 def get_document(collection_name: str, doc_id: str) -> Optional[Dict[str, Any]]:
     """Get a single document from Firestore"""
-    if db is None:
-        raise Exception("Firestore not configured")
-    doc_ref = db.collection(collection_name).document(doc_id)
-    doc = doc_ref.get()
-    if doc.exists:
-        return doc.to_dict()
-    return None
+    return get_storage().get(collection_name, doc_id)
 
 def get_collection(collection_name: str) -> List[Dict[str, Any]]:
     """Get all documents from a collection"""
-    if db is None:
-        raise Exception("Firestore not configured")
-    docs = db.collection(collection_name).stream()
-    return [doc.to_dict() for doc in docs]
+    return get_storage().query(collection_name)
 
 def update_document(collection_name: str, doc_id: str, data: dict):
     """Update a document in Firestore"""
-    if db is None:
-        raise Exception("Firestore not configured")
     data["updated_at"] = datetime.utcnow()
-    db.collection(collection_name).document(doc_id).update(data)
+    get_storage().update(collection_name, doc_id, data)
     return data
 
 def delete_document(collection_name: str, doc_id: str):
     """Delete a document from Firestore"""
-    if db is None:
-        raise Exception("Firestore not configured")
-    db.collection(collection_name).document(doc_id).delete()
+    get_storage().delete(collection_name, doc_id)
     return True
 
 def query_collection(collection_name: str, field: str, operator: str, value: Any) -> List[Dict[str, Any]]:
     """Query a collection with a specific condition"""
-    if db is None:
-        raise Exception("Firestore not configured")
-    
-    docs = db.collection(collection_name).where(field, operator, value).stream()
-    return [doc.to_dict() for doc in docs]
+    return get_storage().query(collection_name, filters=[(field, operator, value)])
+
+def get_documents(collection_name: str, doc_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Get several documents in one round-trip, keyed by document ID (missing ones are omitted)"""
+    return get_storage().get_many(collection_name, doc_ids)
+
+def batch_write(operations: List[WriteOperation]):
+    """Apply ("set" | "merge" | "update" | "delete", collection, doc_id, data) writes atomically"""
+    now = datetime.utcnow()
+    stamped = []
+    for operation, collection_name, doc_id, data in operations:
+        if operation == "update":
+            data = {**data, "updated_at": now}
+        stamped.append((operation, collection_name, doc_id, data))
+    get_storage().batch_write(stamped)
 
+def advance_field(collection_name: str, field: str, values: Dict[str, Any]) -> List[str]:
+    """Set `field` per document only where it moves forward; returns the ids of missing documents"""
+    return get_storage().update_if_greater(collection_name, field, values, {"updated_at": datetime.utcnow()})
 
 def get_user_by_email(email: str) -> Optional[Dict[str, Any]]:
     """Get user by email address from Firestore"""
@@ -66,130 +70,327 @@ def get_user_by_email(email: str) -> Optional[Dict[str, Any]]:
         print(f"Error fetching user by email {email}: {e}")
         return None
 
+def get_users_by_emails(emails: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Get users for several email addresses, keyed by email (unknown emails are omitted)"""
+    users: Dict[str, Dict[str, Any]] = {}
+    emails = list(dict.fromkeys(emails))
+    # Firestore "in" filters accept at most 30 values
+    for start in range(0, len(emails), 30):
+        for user in query_collection("users", "email", "in", emails[start:start + 30]):
+            if "userId" not in user:
+                user["userId"] = user.get("uid") or user.get("id")
+            users.setdefault(user["email"], user)
+    return users
 
-def get_team_messages(team_id: str, limit: int = 50) -> List[Dict[str, Any]]:
-    """Get messages for a specific team, ordered by creation time"""
-    if db is None:
-        raise Exception("Firestore not configured")
+
+def encode_message_cursor(message: Dict[str, Any]) -> str:
+    """Encode a message's (created_at, messageId) position as an opaque pagination cursor"""
+    created_at = message["created_at"]
+    if isinstance(created_at, datetime):
+        created_at = created_at.isoformat()
+    payload = json.dumps({"created_at": created_at, "messageId": message["messageId"]})
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+def decode_message_cursor(cursor: str) -> Dict[str, Any]:
+    """Decode a cursor produced by encode_message_cursor, raising ValueError if malformed"""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return {
+            "created_at": datetime.fromisoformat(data["created_at"]),
+            "messageId": data["messageId"]
+        }
+    except Exception as e:
+        raise ValueError(f"Invalid message cursor: {cursor}") from e
+
+def get_team_messages_page(
+    team_id: str,
+    limit: int = 50,
+    before: Optional[str] = None,
+    after: Optional[str] = None
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Get one page of a team's messages (oldest first) plus the cursor for the next page.
+
+    Without cursors the newest `limit` messages are returned and the cursor points at
+    older history. `before` continues towards older messages, `after` fetches messages
+    newer than the cursor (the returned cursor then continues forwards). The cursor is
+    None once there are no more messages in that direction.
+    """
+    # Decode before querying so malformed cursors surface as ValueError to the caller
+    for cursor in (before, after):
+        if cursor:
+            decode_message_cursor(cursor)
     try:
-        messages_ref = db.collection("messages").where("teamId", "==", team_id)
-        messages_ref = messages_ref.order_by("created_at", direction="DESCENDING").limit(limit)
-        docs = messages_ref.stream()
-        messages = [doc.to_dict() for doc in docs]
-        # Sort in ascending order (oldest first) for chat display
-        return list(reversed(messages))
+        return query_team_messages_page(team_id, limit, before, after)
     except Exception as e:
         print(f"Error fetching messages: {e}")
-        # If index doesn't exist or other error, try without ordering
-        try:
-            messages_ref = db.collection("messages").where("teamId", "==", team_id).limit(limit)
-            docs = messages_ref.stream()
-            return [doc.to_dict() for doc in docs]
-        except Exception as e2:
-            print(f"Error fetching messages without order: {e2}")
-            return []
+        return [], None
+
+def query_team_messages_page(
+    team_id: str,
+    limit: int = 50,
+    before: Optional[str] = None,
+    after: Optional[str] = None
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Same as get_team_messages_page, but storage errors are raised instead of returning an empty page"""
+    storage = get_storage()
+    before_position = decode_message_cursor(before) if before else None
+    after_position = decode_message_cursor(after) if after else None
+    filters = [("teamId", "==", team_id)]
+    try:
+        direction = ASCENDING if after_position else DESCENDING
+        # Fetch one extra document to know whether another page exists
+        messages = storage.query(
+            "messages",
+            filters=filters,
+            order_by=[("created_at", direction), ("messageId", direction)],
+            limit=limit + 1,
+            start_after=after_position or before_position
+        )
+        has_more = len(messages) > limit
+        messages = messages[:limit]
+        next_cursor = encode_message_cursor(messages[-1]) if has_more else None
+        if not after_position:
+            # Sort in ascending order (oldest first) for chat display
+            messages.reverse()
+        return messages, next_cursor
+    except MissingIndexError as e:
+        # Composite index missing: answer correctly (but expensively) in memory
+        _record_index_fallback("messages_by_team", e)
+        messages = storage.query("messages", filters=filters)
+        return _paginate_messages(messages, limit, before_position, after_position)
+
+def message_timestamp(value: Any) -> datetime:
+    """Normalize a created_at value (naive, aware or ISO string) to naive UTC for ordering"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def _message_position(message: Dict[str, Any]) -> Tuple[datetime, str]:
+    # Firestore returns aware datetimes; cursors and buffered messages carry naive UTC
+    return message_timestamp(message["created_at"]), message["messageId"]
+
+def _paginate_messages(
+    messages: List[Dict[str, Any]],
+    limit: int,
+    before_position: Optional[Dict[str, Any]],
+    after_position: Optional[Dict[str, Any]]
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Apply get_team_messages_page's ordering and cursor semantics to an in-memory list"""
+    messages = sorted(messages, key=_message_position)
+    if after_position:
+        position = _message_position(after_position)
+        newer = [message for message in messages if _message_position(message) > position]
+        page = newer[:limit]
+        next_cursor = encode_message_cursor(page[-1]) if len(newer) > limit else None
+        return page, next_cursor
+    if before_position:
+        position = _message_position(before_position)
+        messages = [message for message in messages if _message_position(message) < position]
+    page = messages[-limit:] if limit > 0 else []
+    next_cursor = encode_message_cursor(page[0]) if len(messages) > limit else None
+    return page, next_cursor
+
+def get_team_messages(team_id: str, limit: int = 50) -> List[Dict[str, Any]]:
+    """Get messages for a specific team, ordered by creation time"""
+    messages, _ = get_team_messages_page(team_id, limit)
+    return messages
+
+def build_member_ids(admin_id: Optional[str], members: List[Dict[str, Any]]) -> List[str]:
+    """Build the denormalized member_ids index (admin + members) stored on team documents"""
+    member_ids = [admin_id] if admin_id else []
+    for member in members:
+        user_id = member.get("user_id")
+        if user_id and user_id not in member_ids:
+            member_ids.append(user_id)
+    return member_ids
 
 def get_user_teams(user_id: str) -> List[Dict[str, Any]]:
     """Get all teams a user is a member of"""
-    if db is None:
-        raise Exception("Firestore not configured")
-    teams_ref = db.collection("teams")
-    docs = teams_ref.stream()
-    user_teams = []
-    for doc in docs:
-        team_data = doc.to_dict()
-        # Check if user is admin or member
-        if (team_data.get("admin_id") == user_id or 
-            any(member.get("user_id") == user_id for member in team_data.get("members", []))):
-            user_teams.append(team_data)
-    return user_teams
+    # member_ids is maintained on every membership change, so this is a single indexed query
+    return get_storage().query("teams", filters=[("member_ids", "array_contains", user_id)])
 
 def add_team_member(team_id: str, member_data: Dict[str, Any]):
     """Add a member to a team"""
-    if db is None:
-        raise Exception("Firestore not configured")
-    team_ref = db.collection("teams").document(team_id)
-    team_doc = team_ref.get()
+    storage = get_storage()
+    team_data = storage.get("teams", team_id)
     
-    if team_doc.exists:
-        team_data = team_doc.to_dict()
+    if team_data:
         members = team_data.get("members", [])
         
         # Check if member already exists
         if not any(member.get("user_id") == member_data["user_id"] for member in members):
             members.append(member_data)
-            team_ref.update({"members": members, "updated_at": datetime.utcnow()})
+            storage.update("teams", team_id, {
+                "members": members,
+                "member_ids": build_member_ids(team_data.get("admin_id"), members),
+                "updated_at": datetime.utcnow()
+            })
+            invalidate_team_membership(team_id)
             return True
     return False
 
 def remove_team_member(team_id: str, user_id: str):
     """Remove a member from a team"""
-    if db is None:
-        raise Exception("Firestore not configured")
-    team_ref = db.collection("teams").document(team_id)
-    team_doc = team_ref.get()
+    storage = get_storage()
+    team_data = storage.get("teams", team_id)
     
-    if team_doc.exists:
-        team_data = team_doc.to_dict()
+    if team_data:
         members = team_data.get("members", [])
         
         # Remove member
         members = [member for member in members if member.get("user_id") != user_id]
-        team_ref.update({"members": members, "updated_at": datetime.utcnow()})
+        storage.update("teams", team_id, {
+            "members": members,
+            "member_ids": build_member_ids(team_data.get("admin_id"), members),
+            "updated_at": datetime.utcnow()
+        })
+        invalidate_team_membership(team_id)
         return True
     return False
 
+def backfill_team_member_ids() -> int:
+    """Populate member_ids on team documents created before the index existed"""
+    storage = get_storage()
+    operations = []
+    for team_data in storage.query("teams"):
+        member_ids = build_member_ids(team_data.get("admin_id"), team_data.get("members", []))
+        if team_data.get("member_ids") != member_ids:
+            operations.append(("update", "teams", team_data["teamId"], {"member_ids": member_ids}))
+    storage.batch_write(operations)
+    return len(operations)
+
 # Todo-related functions
+def build_assignee_index(assigned_users: List[Dict[str, Any]]) -> Dict[str, List[str]]:
+    """Build the denormalized assignee fields used for array_contains queries on todos"""
+    return {
+        "assigned_emails": [user["email"] for user in assigned_users if user.get("email")],
+        "assigned_user_ids": [user["user_id"] for user in assigned_users if user.get("user_id")]
+    }
+
 def create_todo(todo_id: str, todo_data: Dict[str, Any]) -> Dict[str, Any]:
     """Create a new todo in Firestore"""
-    if db is None:
-        raise Exception("Firestore not configured")
-    db.collection("todos").document(todo_id).set(todo_data)
+    todo_data.update(build_assignee_index(todo_data.get("assigned_users", [])))
+    get_storage().set("todos", todo_id, todo_data)
     return todo_data
 
+def update_todo(todo_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    """Update a todo, keeping the assignee index in sync with assigned_users"""
+    if "assigned_users" in data:
+        data.update(build_assignee_index(data["assigned_users"]))
+    # Todo timestamps are stored as ISO strings, unlike update_document's datetime
+    data["updated_at"] = datetime.utcnow().isoformat()
+    get_storage().update("todos", todo_id, data)
+    return data
+
 def get_todo(todo_id: str) -> Optional[Dict[str, Any]]:
     """Get a single todo by ID"""
     return get_document("todos", todo_id)
 
 def get_team_todos(team_id: str) -> List[Dict[str, Any]]:
     """Get all todos for a specific team"""
-    if db is None:
-        raise Exception("Firestore not configured")
+    storage = get_storage()
+    filters = [("team_id", "==", team_id)]
     try:
-        todos_ref = db.collection("todos").where("team_id", "==", team_id)
-        todos_ref = todos_ref.order_by("created_at", direction="DESCENDING")
-        docs = todos_ref.stream()
-        return [doc.to_dict() for doc in docs]
+        return storage.query("todos", filters=filters, order_by=[("created_at", DESCENDING)])
+    except MissingIndexError as e:
+        # Composite index missing: answer correctly (but expensively) in memory
+        _record_index_fallback("todos_by_team", e)
+        todos = storage.query("todos", filters=filters)
+        todos.sort(key=lambda todo: todo.get("created_at") or "", reverse=True)
+        return todos
     except Exception as e:
         print(f"Error fetching todos: {e}")
-        # Fallback without ordering if index doesn't exist
-        try:
-            todos_ref = db.collection("todos").where("team_id", "==", team_id)
-            docs = todos_ref.stream()
-            return [doc.to_dict() for doc in docs]
-        except Exception as e2:
-            print(f"Error fetching todos without order: {e2}")
-            return []
-
-def get_user_todos(user_email: str) -> List[Dict[str, Any]]:
-    """Get all todos assigned to a specific user"""
-    if db is None:
-        raise Exception("Firestore not configured")
+        return []
+
+def get_user_todos(
+    user_email: str,
+    status: Optional[str] = None,
+    priority: Optional[str] = None,
+    deadline_before: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """Get all todos assigned to a specific user, optionally filtered server-side"""
+    storage = get_storage()
+    assignee_filter = ("assigned_emails", "array_contains", user_email)
+    filters = [assignee_filter]
+    if status:
+        filters.append(("status", "==", status))
+    if priority:
+        filters.append(("priority", "==", priority))
+    if deadline_before:
+        # Deadlines are stored as ISO-8601 strings, which sort chronologically
+        filters.append(("deadline", "<=", deadline_before))
     try:
-        todos_ref = db.collection("todos")
-        docs = todos_ref.stream()
-        user_todos = []
-        for doc in docs:
-            todo_data = doc.to_dict()
-            # Check if user is assigned to this todo
-            assigned_users = todo_data.get("assigned_users", [])
-            if any(user.get("email") == user_email for user in assigned_users):
-                user_todos.append(todo_data)
-        return user_todos
+        return storage.query("todos", filters=filters)
+    except MissingIndexError as e:
+        # Composite index missing: filter the user's todos in memory
+        _record_index_fallback("todos_by_assignee", e)
+        return [
+            todo for todo in storage.query("todos", filters=[assignee_filter])
+            if (not status or todo.get("status") == status)
+            and (not priority or todo.get("priority") == priority)
+            and (not deadline_before or (todo.get("deadline") and todo["deadline"] <= deadline_before))
+        ]
     except Exception as e:
         print(f"Error fetching user todos: {e}")
         return []
 
+def backfill_todo_assignees() -> int:
+    """Populate assigned_emails/assigned_user_ids on todos created before the index existed"""
+    storage = get_storage()
+    operations = []
+    for todo_data in storage.query("todos"):
+        index = build_assignee_index(todo_data.get("assigned_users", []))
+        if any(todo_data.get(field) != value for field, value in index.items()):
+            operations.append(("update", "todos", todo_data["todo_id"], index))
+    storage.batch_write(operations)
+    return len(operations)
+
 def delete_todo(todo_id: str) -> bool:
     """Delete a todo from Firestore"""
     return delete_document("todos", todo_id)
+
+# Index bookkeeping
+def _record_index_fallback(query_name: str, error: Exception):
+    """Count and log a query served without its composite index"""
+    metrics_service.increment(f"firestore.index_fallback.{query_name}")
+    print(f"Missing Firestore index for '{query_name}', using in-memory fallback "
+          f"(deploy firestore.indexes.json): {error}")
+
+def _required_index_probes() -> Dict[str, Dict[str, Any]]:
+    """One representative query per composite index in firestore.indexes.json"""
+    by_team = [("teamId", "==", "")]
+    by_assignee = [("assigned_emails", "array_contains", "")]
+    status, priority, deadline = ("status", "==", ""), ("priority", "==", ""), ("deadline", "<=", "")
+    return {
+        "messages_by_team_desc": {"collection": "messages", "filters": by_team,
+                                  "order_by": [("created_at", DESCENDING), ("messageId", DESCENDING)]},
+        "messages_by_team_asc": {"collection": "messages", "filters": by_team,
+                                 "order_by": [("created_at", ASCENDING), ("messageId", ASCENDING)]},
+        "todos_by_team": {"collection": "todos", "filters": [("team_id", "==", "")],
+                          "order_by": [("created_at", DESCENDING)]},
+        "todos_by_assignee_status": {"collection": "todos", "filters": by_assignee + [status]},
+        "todos_by_assignee_priority": {"collection": "todos", "filters": by_assignee + [priority]},
+        "todos_by_assignee_status_priority": {"collection": "todos", "filters": by_assignee + [status, priority]},
+        "todos_by_assignee_deadline": {"collection": "todos", "filters": by_assignee + [deadline]},
+        "todos_by_assignee_status_deadline": {"collection": "todos", "filters": by_assignee + [status, deadline]},
+        "todos_by_assignee_priority_deadline": {"collection": "todos", "filters": by_assignee + [priority, deadline]},
+        "todos_by_assignee_status_priority_deadline": {"collection": "todos",
+                                                       "filters": by_assignee + [status, priority, deadline]},
+    }
+
+def check_required_indexes() -> List[str]:
+    """Run each indexed query once and return the names of those whose index is missing"""
+    storage = get_storage()
+    if not storage.available:
+        raise Exception("Firestore not configured")
+    missing = []
+    for name, probe in _required_index_probes().items():
+        try:
+            storage.query(probe["collection"], filters=probe["filters"], order_by=probe.get("order_by", ()), limit=1)
+        except MissingIndexError as e:
+            print(f"Missing Firestore index '{name}': {e}")
+            missing.append(name)
+    return missing
@@ -0,0 +1,297 @@
+"""
+Per-team ring buffer of the most recent messages.
+
+Messages are added as they are written (REST routes and the WebSocket path on this worker,
+plus broadcasts received from other workers), and edits, deletions and reactions are applied
+in place. A team's buffer is warmed from Firestore the first time it is read, after which it
+holds the team's latest MESSAGE_BUFFER_SIZE messages. Recent-history readers (message list,
+WebSocket welcome and delta sync, assistant context, summaries) are served from it whenever
+the requested window fits. Idle teams are evicted least-recently-used first once
+MESSAGE_BUFFER_MAX_TEAMS or MESSAGE_BUFFER_MAX_BYTES is exceeded. With several workers (Redis
+broker) only teams with a local room are buffered, since only their broadcasts reach this
+worker; other teams are read from Firestore with the caller's own limit.
+"""
+import asyncio
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+from app.config import (
+    MESSAGE_BUFFER_SIZE, WS_SYNC_MAX_MESSAGES, MESSAGE_BUFFER_MAX_TEAMS, MESSAGE_BUFFER_MAX_BYTES
+)
+from app.services.async_firestore_service import get_team_messages, query_team_messages_page
+from app.services.firestore_service import message_timestamp
+from app.services.metrics_service import register_provider
+
+def _position(message: Dict[str, Any]) -> Tuple[datetime, str]:
+    return message_timestamp(message["created_at"]), message["messageId"]
+
+def _estimate_size(message: Dict[str, Any]) -> int:
+    # Rough per-message footprint: fixed overhead for ids, timestamps and names plus the text
+    return 512 + len(message.get("content") or "")
+
+class TeamMessageBuffer:
+    """Latest messages of one team, oldest first"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.messages: Deque[Dict[str, Any]] = deque()
+        self.ids: Dict[str, Dict[str, Any]] = {}
+        self.size_bytes = 0
+        # True once the buffer is known to hold the team's latest messages
+        self.warm = False
+
+    def add(self, message: Dict[str, Any]):
+        if message["messageId"] in self.ids:
+            return
+        self.ids[message["messageId"]] = message
+        self.size_bytes += _estimate_size(message)
+        if self.messages and _position(message) < _position(self.messages[-1]):
+            # Rare out-of-order arrival (e.g. a slower worker); keep the buffer sorted
+            self.messages = deque(sorted([*self.messages, message], key=_position))
+        else:
+            self.messages.append(message)
+        while len(self.messages) > self.capacity:
+            evicted = self.messages.popleft()
+            del self.ids[evicted["messageId"]]
+            self.size_bytes -= _estimate_size(evicted)
+
+    def update(self, message_id: str, data: Dict[str, Any]):
+        message = self.ids.get(message_id)
+        if message is not None:
+            self.size_bytes -= _estimate_size(message)
+            message.update(data)
+            self.size_bytes += _estimate_size(message)
+
+    def remove(self, message_id: str):
+        message = self.ids.pop(message_id, None)
+        if message is not None:
+            self.messages.remove(message)
+            self.size_bytes -= _estimate_size(message)
+
+    def react(self, message_id: str, emoji: str, user_email: str, added: bool):
+        message = self.ids.get(message_id)
+        if message is None:
+            return
+        reactions = dict(message.get("reactions") or {})
+        users = [user for user in reactions.get(emoji, []) if user != user_email]
+        if added:
+            users.append(user_email)
+        reactions[emoji] = users
+        message["reactions"] = reactions
+
+    @property
+    def full(self) -> bool:
+        return len(self.messages) >= self.capacity
+
+class MessageBufferService:
+    """Ring buffers for the teams most recently read or written by this worker"""
+
+    def __init__(
+        self,
+        capacity: int = MESSAGE_BUFFER_SIZE,
+        max_teams: int = MESSAGE_BUFFER_MAX_TEAMS,
+        max_bytes: int = MESSAGE_BUFFER_MAX_BYTES
+    ):
+        self.capacity = capacity
+        self.max_teams = max_teams
+        self.max_bytes = max_bytes
+        # Least recently used first
+        self.buffers: "OrderedDict[str, TeamMessageBuffer]" = OrderedDict()
+        self.total_bytes = 0
+        # Whether other workers' changes to a team reach this worker (see websocket_service);
+        # None with a single worker, where every change does
+        self.is_live: Optional[Callable[[str], bool]] = None
+        self.hits = 0
+        self.misses = 0
+        self.warm_loads = 0
+        self.warm_failures = 0
+        self.evictions = 0
+        self.sync_requests = 0
+        self.sync_gaps = 0
+        self._warming: Dict[str, asyncio.Task] = {}
+
+    def _buffer(self, team_id: str) -> TeamMessageBuffer:
+        buffer = self.buffers.get(team_id)
+        if buffer is None:
+            buffer = self.buffers[team_id] = TeamMessageBuffer(self.capacity)
+        self.buffers.move_to_end(team_id)
+        return buffer
+
+    def _change(self, team_id: str, change: Callable[[TeamMessageBuffer], None], create: bool = False):
+        """Apply a change to a team's buffer, keeping the byte count and limits up to date"""
+        if not create and team_id not in self.buffers:
+            return
+        buffer = self._buffer(team_id)
+        before = buffer.size_bytes
+        change(buffer)
+        self.total_bytes += buffer.size_bytes - before
+        self._enforce_limits()
+
+    def _enforce_limits(self):
+        # Always keep the most recently used team, even if it alone exceeds the byte cap
+        while len(self.buffers) > 1 and (len(self.buffers) > self.max_teams or self.total_bytes > self.max_bytes):
+            _, evicted = self.buffers.popitem(last=False)
+            self.total_bytes -= evicted.size_bytes
+            self.evictions += 1
+
+    def serves(self, team_id: str) -> bool:
+        """Whether the team's reads may be answered from the buffer"""
+        return self.is_live is None or self.is_live(team_id)
+
+    def discard(self, team_id: str):
+        """Forget a team's buffer so the next read warms it again"""
+        buffer = self.buffers.pop(team_id, None)
+        if buffer is not None:
+            self.total_bytes -= buffer.size_bytes
+
+    def add(self, message: Dict[str, Any]):
+        """Record a newly written message"""
+        team_id = message["teamId"]
+        self._change(team_id, lambda buffer: buffer.add(message), create=self.serves(team_id))
+
+    def update(self, team_id: str, message_id: str, data: Dict[str, Any]):
+        """Apply an edit to a buffered message"""
+        self._change(team_id, lambda buffer: buffer.update(message_id, data))
+
+    def remove(self, team_id: str, message_id: str):
+        """Drop a deleted message"""
+        self._change(team_id, lambda buffer: buffer.remove(message_id))
+
+    def react(self, team_id: str, message_id: str, emoji: str, user_email: str, added: bool):
+        """Apply a reaction change to a buffered message"""
+        self._change(team_id, lambda buffer: buffer.react(message_id, emoji, user_email, added))
+
+    def apply_event(self, team_id: str, frame: Dict[str, Any]):
+        """Apply a message event broadcast by another worker"""
+        event_type = frame.get("type")
+        if event_type == "new_message":
+            self.add(frame["message"])
+        elif event_type == "message_updated":
+            self.update(team_id, frame["message"]["messageId"], frame["message"])
+        elif event_type == "message_deleted":
+            self.remove(team_id, frame["message_id"])
+        elif event_type in ("reaction_added", "reaction_removed"):
+            self.react(team_id, frame["message_id"], frame["emoji"], frame["user_email"], event_type == "reaction_added")
+
+    async def _warm(self, team_id: str):
+        # Raises on storage errors, so a failed read never leaves an empty buffer marked warm
+        try:
+            stored, _ = await query_team_messages_page(team_id, self.capacity)
+        except Exception:
+            self.warm_failures += 1
+            raise
+
+        def load(buffer: TeamMessageBuffer):
+            # Messages added while the read was in flight are kept; add() dedups by messageId
+            for message in stored:
+                buffer.add(message)
+            buffer.warm = True
+        self._change(team_id, load, create=True)
+        self.warm_loads += 1
+
+    async def ensure_warm(self, team_id: str) -> TeamMessageBuffer:
+        """
+        Return the team's buffer, loading it from Firestore once (concurrent callers share the load).
+        Raises if the load fails. Only for teams the buffer serves.
+        """
+        buffer = self.buffers.get(team_id)
+        if buffer is not None and buffer.warm:
+            self.hits += 1
+            self.buffers.move_to_end(team_id)
+            return buffer
+        self.misses += 1
+        task = self._warming.get(team_id)
+        if task is None:
+            task = self._warming[team_id] = asyncio.create_task(self._warm(team_id))
+            task.add_done_callback(lambda _: self._warming.pop(team_id, None))
+        await task
+        return self._buffer(team_id)
+
+    async def get_latest(self, team_id: str, limit: int) -> Tuple[List[Dict[str, Any]], bool]:
+        """Latest `limit` messages (limit <= capacity), oldest first, and whether older ones exist; raises if the load fails"""
+        buffer = await self.ensure_warm(team_id)
+        messages = list(buffer.messages)
+        has_more = len(messages) > limit or buffer.full
+        return [dict(message) for message in messages[max(len(messages) - limit, 0):]], has_more
+
+    async def get_recent_messages(self, team_id: str, limit: int = 50) -> List[Dict[str, Any]]:
+        """Latest messages of a team, oldest first, from the buffer when the window fits"""
+        if limit <= 0:
+            return []
+        if limit <= self.capacity and self.serves(team_id):
+            try:
+                messages, _ = await self.get_latest(team_id, limit)
+                return messages
+            except Exception as e:
+                print(f"Recent-message buffer unavailable for team {team_id}: {e}")
+        return await get_team_messages(team_id, limit)
+
+    async def get_since(
+        self,
+        team_id: str,
+        since: str,
+        limit: int = WS_SYNC_MAX_MESSAGES
+    ) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Messages after `since` (a messageId or an ISO timestamp), oldest first.
+        The flag is True when the gap can't be filled exactly (unknown or evicted position, or
+        more than `limit` missed messages); the latest `limit` messages are returned instead.
+        """
+        self.sync_requests += 1
+        buffer = None
+        if self.serves(team_id):
+            try:
+                buffer = await self.ensure_warm(team_id)
+            except Exception as e:
+                print(f"Recent-message buffer unavailable for team {team_id}: {e}")
+        if buffer is None:
+            # The client falls back to a full reload, as for any gap
+            self.sync_gaps += 1
+            return [], True
+        messages = list(buffer.messages)
+
+        gap_too_large = False
+        if since in buffer.ids:
+            start = next(i for i, message in enumerate(messages) if message["messageId"] == since) + 1
+        else:
+            try:
+                since_time = message_timestamp(since)
+            except ValueError:
+                since_time = None
+            if since_time is None:
+                # Unknown messageId: too old for the buffer, or deleted
+                start, gap_too_large = max(len(messages) - limit, 0), True
+            else:
+                start = next(
+                    (i for i, message in enumerate(messages) if message_timestamp(message["created_at"]) > since_time),
+                    len(messages)
+                )
+                # A full buffer may have evicted messages newer than `since`
+                if start == 0 and buffer.full:
+                    gap_too_large = True
+
+        missed = messages[start:]
+        if len(missed) > limit:
+            missed, gap_too_large = missed[-limit:], True
+        if gap_too_large:
+            self.sync_gaps += 1
+        return [dict(message) for message in missed], gap_too_large
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "teams": len(self.buffers),
+            "messages": sum(len(buffer.messages) for buffer in self.buffers.values()),
+            "approx_bytes": self.total_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "warm_loads": self.warm_loads,
+            "warm_failures": self.warm_failures,
+            "evictions": self.evictions,
+            "sync_requests": self.sync_requests,
+            "sync_gaps": self.sync_gaps
+        }
+
+message_buffer = MessageBufferService()
+register_provider("message_buffer", message_buffer.stats)
@@ -0,0 +1,125 @@
+"""
+Background vector indexing of chat messages.
+
+Message writers (the REST route and the WebSocket path) enqueue stored message documents
+and return immediately; a background task drains the queue in micro-batches into the vector
+store, on its own thread so embedding never competes with the Firestore pool. The queue is
+bounded: when it is full the oldest entry is dropped (run `manage.py reindex-messages` to
+recover). Failed batches are retried with exponential backoff and dropped after
+VECTOR_INDEX_MAX_ATTEMPTS. Lag is reported as the age of the oldest queued message.
+"""
+import asyncio
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Deque, Dict, Optional, Tuple
+from app.config import (
+    VECTOR_INDEX_QUEUE_SIZE, VECTOR_INDEX_BATCH_SIZE, VECTOR_INDEX_FLUSH_INTERVAL,
+    VECTOR_INDEX_MAX_RETRY_DELAY, VECTOR_INDEX_MAX_ATTEMPTS
+)
+from app.services.vector_db_service import index_messages, is_indexable
+from app.services.metrics_service import register_provider
+
+class MessageIndexer:
+    """Queues message documents and embeds them into the vector store from a background task"""
+
+    def __init__(self, max_size: int = VECTOR_INDEX_QUEUE_SIZE, batch_size: int = VECTOR_INDEX_BATCH_SIZE):
+        self.max_size = max_size
+        self.batch_size = batch_size
+        # (message, monotonic enqueue time), oldest first
+        self.pending: Deque[Tuple[Dict[str, Any], float]] = deque()
+        self.indexed = 0
+        self.dropped = 0
+        self.failed_batches = 0
+        self.abandoned = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self._attempts = 0
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def enqueue(self, message: Dict[str, Any]):
+        """Queue a stored message for indexing (starts the worker on first use)"""
+        if not is_indexable(message):
+            return
+        if len(self.pending) >= self.max_size:
+            self.pending.popleft()
+            self.dropped += 1
+        self.pending.append((message, time.monotonic()))
+        if self._task is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="vector-index")
+            self._task = asyncio.create_task(self._run())
+        if len(self.pending) >= self.batch_size:
+            self._wakeup.set()
+
+    async def _run(self):
+        delay = VECTOR_INDEX_FLUSH_INTERVAL
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if await self.flush():
+                delay = VECTOR_INDEX_FLUSH_INTERVAL
+            else:
+                delay = min(delay * 2, VECTOR_INDEX_MAX_RETRY_DELAY)
+
+    async def flush(self) -> bool:
+        """Index everything pending; returns False, keeping the rest queued, if a batch fails"""
+        loop = asyncio.get_running_loop()
+        while self.pending:
+            batch = [self.pending.popleft() for _ in range(min(len(self.pending), self.batch_size))]
+            try:
+                await loop.run_in_executor(self._executor, index_messages, [message for message, _ in batch])
+            except Exception as e:
+                self.failed_batches += 1
+                self._attempts += 1
+                if self._attempts >= VECTOR_INDEX_MAX_ATTEMPTS:
+                    # Likely a bad batch rather than an outage; don't let it block the queue
+                    self._attempts = 0
+                    self.abandoned += len(batch)
+                    print(f"Giving up indexing {len(batch)} messages after {VECTOR_INDEX_MAX_ATTEMPTS} attempts: {e}")
+                    continue
+                self.pending.extendleft(reversed(batch))
+                print(f"Vector indexing batch of {len(batch)} messages failed, will retry: {e}")
+                return False
+            self._attempts = 0
+            self.indexed += len(batch)
+            self.last_lag = time.monotonic() - batch[0][1]
+            self.max_lag = max(self.max_lag, self.last_lag)
+        return True
+
+    def lag(self) -> float:
+        """Seconds the oldest queued message has been waiting"""
+        return time.monotonic() - self.pending[0][1] if self.pending else 0.0
+
+    async def stop(self):
+        """Stop the background task and index what is still pending (one attempt)"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            if not await self.flush():
+                print(f"Vector indexing shutdown flush failed; {len(self.pending)} messages were not indexed")
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": len(self.pending),
+            "lag_seconds": round(self.lag(), 3),
+            "last_batch_lag_seconds": round(self.last_lag, 3),
+            "max_lag_seconds": round(self.max_lag, 3),
+            "indexed": self.indexed,
+            "dropped": self.dropped,
+            "failed_batches": self.failed_batches,
+            "abandoned": self.abandoned
+        }
+
+message_indexer = MessageIndexer()
+register_provider("vector_indexing", message_indexer.stats)
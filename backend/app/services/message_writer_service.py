@@ -0,0 +1,87 @@
+"""
+Write-behind persistence for chat messages sent over WebSockets.
+
+With CHAT_WRITE_BEHIND enabled, the WebSocket path broadcasts a message as soon as it has
+its server-assigned ID and hands it to this writer, which persists messages in batches
+(last_message_at is handled by team_activity_service). Failed batches stay queued and are
+retried with exponential backoff, and whatever is still pending is flushed on shutdown.
+"""
+import asyncio
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+from app.config import WRITE_BEHIND_FLUSH_INTERVAL, WRITE_BEHIND_BATCH_SIZE, WRITE_BEHIND_MAX_RETRY_DELAY
+from app.services.async_firestore_service import batch_write
+from app.services.metrics_service import register_provider
+
+class WriteBehindMessageWriter:
+    """Queues message documents and persists them from a background task"""
+
+    def __init__(self):
+        self.pending: Deque[Dict[str, Any]] = deque()
+        self.written = 0
+        self.failed_batches = 0
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def enqueue(self, message: Dict[str, Any]):
+        """Queue a message document for persistence (starts the writer on first use)"""
+        self.pending.append(message)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        if len(self.pending) >= WRITE_BEHIND_BATCH_SIZE:
+            self._wakeup.set()
+
+    async def _run(self):
+        delay = WRITE_BEHIND_FLUSH_INTERVAL
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if await self.flush():
+                delay = WRITE_BEHIND_FLUSH_INTERVAL
+            else:
+                delay = min(delay * 2, WRITE_BEHIND_MAX_RETRY_DELAY)
+
+    async def flush(self) -> bool:
+        """Persist everything pending; returns False, keeping the rest queued, if a batch fails"""
+        while self.pending:
+            batch = [self.pending.popleft() for _ in range(min(len(self.pending), WRITE_BEHIND_BATCH_SIZE))]
+            try:
+                await self._write_batch(batch)
+            except Exception as e:
+                self.pending.extendleft(reversed(batch))
+                self.failed_batches += 1
+                print(f"Write-behind batch of {len(batch)} messages failed, will retry: {e}")
+                return False
+            self.written += len(batch)
+        return True
+
+    async def _write_batch(self, batch: List[Dict[str, Any]]):
+        await batch_write([("set", "messages", message["messageId"], message) for message in batch])
+
+    async def stop(self):
+        """Stop the background task and flush what is still pending"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for _ in range(3):
+            if await self.flush():
+                return
+            await asyncio.sleep(WRITE_BEHIND_FLUSH_INTERVAL)
+        print(f"Write-behind shutdown flush failed; {len(self.pending)} messages were not persisted")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": len(self.pending),
+            "written": self.written,
+            "failed_batches": self.failed_batches
+        }
+
+message_writer = WriteBehindMessageWriter()
+register_provider("chat_write_behind", message_writer.stats)
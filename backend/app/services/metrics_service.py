@@ -0,0 +1,34 @@
+import threading
+from collections import defaultdict
+from typing import Any, Callable, Dict
+
+# Process-local counters, e.g. "firestore.index_fallback.messages"
+_counters: Dict[str, int] = defaultdict(int)
+_counters_lock = threading.Lock()
+
+# Named callables returning a dict of current values (cache stats, queue depths, ...)
+_providers: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+def increment(name: str, amount: int = 1):
+    """Increment a named counter"""
+    with _counters_lock:
+        _counters[name] += amount
+
+def get_counter(name: str) -> int:
+    """Read the current value of a counter"""
+    return _counters.get(name, 0)
+
+def register_provider(name: str, provider: Callable[[], Dict[str, Any]]):
+    """Expose a component's stats under the given name in snapshot()"""
+    _providers[name] = provider
+
+def snapshot() -> Dict[str, Any]:
+    """Collect all counters and provider stats"""
+    with _counters_lock:
+        data: Dict[str, Any] = {"counters": dict(_counters)}
+    for name, provider in _providers.items():
+        try:
+            data[name] = provider()
+        except Exception as e:
+            data[name] = {"error": str(e)}
+    return data
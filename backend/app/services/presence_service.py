@@ -0,0 +1,159 @@
+"""
+Who is online in each team.
+
+A user is online while they hold at least one connection to the team's room, so several tabs
+count once: only the first connection announces a join and only the last one a leave.
+PresenceTracker counts this worker's connections. With the Redis broker, RedisPresenceStore
+also shares each worker's per-user counts in one Redis hash per team, so joins, leaves and
+the online list account for tabs connected to other workers.
+"""
+import json
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from app.config import PRESENCE_KEY_PREFIX, PRESENCE_TIMEOUT
+from app.services.pubsub_service import PubSubBroker, RedisBroker
+
+class PresenceTracker:
+    """Per-team, per-user connection counts"""
+
+    def __init__(self):
+        # team_id -> user_id -> {"user", "connections", "online_since"}
+        self.teams: Dict[str, Dict[str, Dict[str, Any]]] = {}
+
+    def add(self, team_id: str, user_info: Dict[str, Any]) -> bool:
+        """Count a new connection; returns True if the user just came online"""
+        user_id = user_info.get("uid")
+        members = self.teams.setdefault(team_id, {})
+        entry = members.get(user_id)
+        if entry is None:
+            members[user_id] = {
+                "user": {
+                    "uid": user_id,
+                    "name": user_info.get("name", user_info.get("email", "").split("@")[0]),
+                    "email": user_info.get("email")
+                },
+                "connections": 1,
+                "online_since": datetime.utcnow()
+            }
+            return True
+        entry["connections"] += 1
+        return False
+
+    def remove(self, team_id: str, user_id: str) -> bool:
+        """Forget a closed connection; returns True if it was the user's last one"""
+        members = self.teams.get(team_id)
+        entry = members.get(user_id) if members else None
+        if entry is None:
+            return False
+        entry["connections"] -= 1
+        if entry["connections"] > 0:
+            return False
+        del members[user_id]
+        if not members:
+            del self.teams[team_id]
+        return True
+
+    def entry(self, team_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        """A user's connection count and online time in a team, or None if not connected here"""
+        return self.teams.get(team_id, {}).get(user_id)
+
+    def online(self, team_id: str) -> List[Dict[str, Any]]:
+        """Users currently connected to a team"""
+        return [
+            {**entry["user"], "connections": entry["connections"], "online_since": entry["online_since"]}
+            for entry in self.teams.get(team_id, {}).values()
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "teams": len(self.teams),
+            "online_users": sum(len(members) for members in self.teams.values())
+        }
+
+class RedisPresenceStore:
+    """
+    Every worker's per-user connection counts, in a Redis hash per team.
+    Fields are "<user_id>|<worker_id>"; values carry an expiry that the owning worker refreshes,
+    so the entries of a crashed worker stop counting after PRESENCE_TIMEOUT.
+    """
+
+    def __init__(self, client, worker_id: str, prefix: str = PRESENCE_KEY_PREFIX, timeout: float = PRESENCE_TIMEOUT):
+        self.client = client
+        self.worker_id = worker_id
+        self.prefix = prefix
+        self.timeout = timeout
+
+    def _key(self, team_id: str) -> str:
+        return f"{self.prefix}{team_id}"
+
+    def _value(self, entry: Dict[str, Any]) -> str:
+        return json.dumps({
+            "user": entry["user"],
+            "connections": entry["connections"],
+            "online_since": entry["online_since"].isoformat(),
+            "expires": time.time() + self.timeout
+        })
+
+    def _live_entries(self, fields: Dict) -> List[tuple]:
+        """(user_id, worker_id, value) of the unexpired entries of a team hash"""
+        now = time.time()
+        entries = []
+        for field, value in fields.items():
+            field = field.decode("utf-8") if isinstance(field, bytes) else field
+            value = json.loads(value)
+            if value["expires"] > now:
+                user_id, _, worker_id = field.rpartition("|")
+                entries.append((user_id, worker_id, value))
+        return entries
+
+    async def update(self, team_id: str, user_id: str, entry: Optional[Dict[str, Any]]) -> bool:
+        """
+        Store (or, with entry None, remove) this worker's entry for a user, and return whether
+        another worker also holds a live connection for them. The write and the read run in
+        one MULTI/EXEC, so of two workers racing, exactly one sees the other.
+        """
+        key = self._key(team_id)
+        field = f"{user_id}|{self.worker_id}"
+        async with self.client.pipeline(transaction=True) as pipe:
+            if entry is None:
+                pipe.hdel(key, field)
+            else:
+                pipe.hset(key, field, self._value(entry))
+                pipe.expire(key, int(self.timeout * 2))
+            pipe.hgetall(key)
+            results = await pipe.execute()
+        return any(
+            uid == user_id and worker_id != self.worker_id
+            for uid, worker_id, _ in self._live_entries(results[-1])
+        )
+
+    async def refresh(self, teams: Dict[str, Dict[str, Dict[str, Any]]]):
+        """Extend the expiry of all of this worker's entries (teams as in PresenceTracker.teams)"""
+        if not teams:
+            return
+        async with self.client.pipeline(transaction=False) as pipe:
+            for team_id, members in teams.items():
+                key = self._key(team_id)
+                pipe.hset(key, mapping={f"{user_id}|{self.worker_id}": self._value(entry) for user_id, entry in members.items()})
+                pipe.expire(key, int(self.timeout * 2))
+            await pipe.execute()
+
+    async def online(self, team_id: str) -> List[Dict[str, Any]]:
+        """Users connected to a team on any worker, with their total connection count"""
+        users: Dict[str, Dict[str, Any]] = {}
+        for user_id, _, value in self._live_entries(await self.client.hgetall(self._key(team_id))):
+            online_since = datetime.fromisoformat(value["online_since"])
+            user = users.get(user_id)
+            if user is None:
+                users[user_id] = {**value["user"], "connections": value["connections"], "online_since": online_since}
+            else:
+                user["connections"] += value["connections"]
+                user["online_since"] = min(user["online_since"], online_since)
+        return list(users.values())
+
+def create_presence_store(broker: PubSubBroker, worker_id: str) -> Optional[RedisPresenceStore]:
+    """Share presence through Redis when broadcasts already go through it; None for a single worker"""
+    if isinstance(broker, RedisBroker):
+        return RedisPresenceStore(broker.client, worker_id)
+    return None
@@ -0,0 +1,152 @@
+"""
+Pub/sub layer behind ConnectionManager.broadcast_to_team.
+
+Every broadcast is published to the team's channel and each worker delivers it to the
+sockets it holds locally, so members connected to different uvicorn workers or pods still
+see each other's messages. The in-process broker loops messages straight back (a single
+worker); the Redis broker fans them out across processes.
+
+Select the broker with PUBSUB_BACKEND=memory|redis.
+"""
+import asyncio
+from abc import ABC, abstractmethod
+from typing import Awaitable, Callable, Optional, Set
+from app.config import PUBSUB_BACKEND, REDIS_URL, PUBSUB_CHANNEL_PREFIX
+
+# Called with (team_id, message) for every message published to a subscribed team
+MessageHandler = Callable[[str, str], Awaitable[None]]
+
+class PubSubBroker(ABC):
+    """Interface implemented by every broker"""
+
+    name = "base"
+
+    @abstractmethod
+    async def start(self, handler: MessageHandler):
+        """Begin delivering messages for subscribed teams to the handler"""
+
+    @abstractmethod
+    async def stop(self):
+        """Stop delivering and release connections"""
+
+    @abstractmethod
+    async def subscribe(self, team_id: str):
+        """Start receiving a team's messages (called when its first local socket connects)"""
+
+    @abstractmethod
+    async def unsubscribe(self, team_id: str):
+        """Stop receiving a team's messages (called when its room empties locally)"""
+
+    @abstractmethod
+    async def publish(self, team_id: str, message: str):
+        """Send a message to every worker subscribed to the team"""
+
+class InProcessBroker(PubSubBroker):
+    """Delivers published messages directly to this process's handler"""
+
+    name = "memory"
+
+    def __init__(self):
+        self._handler: Optional[MessageHandler] = None
+        self._subscribed: Set[str] = set()
+
+    async def start(self, handler: MessageHandler):
+        self._handler = handler
+
+    async def stop(self):
+        self._handler = None
+
+    async def subscribe(self, team_id: str):
+        self._subscribed.add(team_id)
+
+    async def unsubscribe(self, team_id: str):
+        self._subscribed.discard(team_id)
+
+    async def publish(self, team_id: str, message: str):
+        if self._handler and team_id in self._subscribed:
+            await self._handler(team_id, message)
+
+class RedisBroker(PubSubBroker):
+    """
+    Redis PUBLISH/SUBSCRIBE with one channel per team.
+    Accepts any redis.asyncio-compatible client (e.g. fakeredis for local testing).
+    """
+
+    name = "redis"
+
+    def __init__(self, url: str = REDIS_URL, client=None, channel_prefix: str = PUBSUB_CHANNEL_PREFIX):
+        if client is None:
+            try:
+                import redis.asyncio as redis
+            except ImportError as e:
+                raise Exception("PUBSUB_BACKEND=redis requires the 'redis' package") from e
+            client = redis.from_url(url)
+        self.client = client
+        self.channel_prefix = channel_prefix
+        self._pubsub = None
+        self._handler: Optional[MessageHandler] = None
+        self._reader: Optional[asyncio.Task] = None
+        # Serializes SUBSCRIBE/UNSUBSCRIBE so a room emptying and refilling can't race
+        self._lock = asyncio.Lock()
+
+    def _channel(self, team_id: str) -> str:
+        return f"{self.channel_prefix}{team_id}"
+
+    async def start(self, handler: MessageHandler):
+        self._handler = handler
+        self._pubsub = self.client.pubsub()
+        self._reader = asyncio.create_task(self._read_loop())
+
+    async def stop(self):
+        if self._reader:
+            self._reader.cancel()
+            try:
+                await self._reader
+            except asyncio.CancelledError:
+                pass
+            self._reader = None
+        if self._pubsub is not None:
+            await self._pubsub.aclose()
+            self._pubsub = None
+
+    async def subscribe(self, team_id: str):
+        async with self._lock:
+            await self._pubsub.subscribe(self._channel(team_id))
+
+    async def unsubscribe(self, team_id: str):
+        async with self._lock:
+            await self._pubsub.unsubscribe(self._channel(team_id))
+
+    async def publish(self, team_id: str, message: str):
+        await self.client.publish(self._channel(team_id), message)
+
+    async def _read_loop(self):
+        while True:
+            try:
+                if not self._pubsub.subscribed:
+                    # Nothing to read until the first room opens on this worker
+                    await asyncio.sleep(0.1)
+                    continue
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if not message or message.get("type") != "message":
+                    continue
+                channel = message["channel"]
+                data = message["data"]
+                if isinstance(channel, bytes):
+                    channel = channel.decode("utf-8")
+                if isinstance(data, bytes):
+                    data = data.decode("utf-8")
+                await self._handler(channel[len(self.channel_prefix):], data)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Pub/sub read error: {e}")
+                await asyncio.sleep(1.0)
+
+def create_broker(backend: str = PUBSUB_BACKEND) -> PubSubBroker:
+    """Create the broker named by PUBSUB_BACKEND"""
+    if backend == "memory":
+        return InProcessBroker()
+    if backend == "redis":
+        return RedisBroker()
+    raise ValueError(f"Unknown pub/sub backend: {backend}")
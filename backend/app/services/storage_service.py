@@ -0,0 +1,628 @@
+"""
+Storage backends behind the data-access helpers in firestore_service.
+
+FirestoreBackend is used in production. InMemoryBackend and SQLiteBackend
+implement the same subset of Firestore semantics (equality/range/array
+filters, multi-field ordering, start_after cursors, array transforms) so the
+API can be run, load-tested and benchmarked without a Firebase project. Every
+backend counts the operations it serves, which makes query-count regressions
+visible through /metrics.
+
+Select the backend with STORAGE_BACKEND=firestore|memory|sqlite.
+"""
+import copy
+import json
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+from app.config import STORAGE_BACKEND, SQLITE_DB_PATH
+
+# (field, operator, value), e.g. ("teamId", "==", team_id)
+Filter = Tuple[str, str, Any]
+# (field, "ASCENDING" | "DESCENDING")
+OrderBy = Tuple[str, str]
+# Update keys are top-level field names, dotted paths, or tuples of path segments
+FieldKey = Union[str, Tuple[str, ...]]
+# ("set" | "merge" | "update" | "delete", collection, doc_id, data)
+WriteOperation = Tuple[str, str, str, Optional[Dict[FieldKey, Any]]]
+
+ASCENDING = "ASCENDING"
+DESCENDING = "DESCENDING"
+
+class MissingIndexError(Exception):
+    """Raised when the backend cannot serve a query without a composite index"""
+
+class DocumentNotFoundError(Exception):
+    """Raised when updating a document that does not exist"""
+
+class ArrayUnion:
+    """Update value that appends elements not already present in an array field"""
+    def __init__(self, values: Iterable[Any]):
+        self.values = list(values)
+
+class ArrayRemove:
+    """Update value that removes all instances of the given elements from an array field"""
+    def __init__(self, values: Iterable[Any]):
+        self.values = list(values)
+
+class StorageBackend(ABC):
+    """Interface implemented by every storage backend"""
+
+    name = "base"
+
+    def __init__(self):
+        self.operation_counts: Dict[str, int] = defaultdict(int)
+
+    @property
+    def available(self) -> bool:
+        """Whether the backend is configured and usable"""
+        return True
+
+    def _count(self, operation: str, amount: int = 1):
+        self.operation_counts[operation] += amount
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name, "operations": dict(self.operation_counts)}
+
+    @abstractmethod
+    def set(self, collection: str, doc_id: str, data: Dict[str, Any]):
+        """Create or overwrite a document"""
+
+    @abstractmethod
+    def get(self, collection: str, doc_id: str) -> Optional[Dict[str, Any]]:
+        """Get a document, or None if it does not exist"""
+
+    @abstractmethod
+    def update(self, collection: str, doc_id: str, data: Dict[FieldKey, Any]):
+        """Update fields of an existing document, raising DocumentNotFoundError if missing"""
+
+    @abstractmethod
+    def delete(self, collection: str, doc_id: str):
+        """Delete a document (no-op if it does not exist)"""
+
+    @abstractmethod
+    def query(
+        self,
+        collection: str,
+        filters: Sequence[Filter] = (),
+        order_by: Sequence[OrderBy] = (),
+        limit: Optional[int] = None,
+        start_after: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """Query a collection; start_after holds the order_by field values of the cursor"""
+
+    @abstractmethod
+    def get_many(self, collection: str, doc_ids: Sequence[str]) -> Dict[str, Dict[str, Any]]:
+        """Get several documents in one round-trip; missing documents are omitted"""
+
+    @abstractmethod
+    def batch_write(self, operations: Sequence[WriteOperation]):
+        """
+        Apply writes atomically in one round-trip ("merge" creates or updates, like set(merge=True)).
+        Raises DocumentNotFoundError, without writing anything, if an "update" targets a missing document.
+        """
+
+    @abstractmethod
+    def update_if_greater(
+        self,
+        collection: str,
+        field: str,
+        values: Dict[str, Any],
+        data: Optional[Dict[str, Any]] = None
+    ) -> List[str]:
+        """
+        Atomically set `field` to values[doc_id] on each document whose stored value is missing or
+        smaller (so concurrent writers can only move it forward), writing `data` along with it.
+        Returns the ids of documents that don't exist.
+        """
+
+# ---------------------------------------------------------------------------
+# Firestore
+# ---------------------------------------------------------------------------
+
+class FirestoreBackend(StorageBackend):
+    """Backend for the Firestore client configured in app.config"""
+
+    name = "firestore"
+
+    def __init__(self, client):
+        super().__init__()
+        self.client = client
+
+    @property
+    def available(self) -> bool:
+        return self.client is not None
+
+    def _db(self):
+        if self.client is None:
+            raise Exception("Firestore not configured")
+        return self.client
+
+    def _field_path(self, key: FieldKey) -> str:
+        if isinstance(key, tuple):
+            from google.cloud.firestore_v1.field_path import FieldPath
+            return FieldPath(*key).to_api_repr()
+        return key
+
+    def _value(self, value: Any) -> Any:
+        from firebase_admin import firestore
+        if isinstance(value, ArrayUnion):
+            return firestore.ArrayUnion(value.values)
+        if isinstance(value, ArrayRemove):
+            return firestore.ArrayRemove(value.values)
+        return value
+
+    def set(self, collection, doc_id, data):
+        self._count("set")
+        self._db().collection(collection).document(doc_id).set(data)
+
+    def get(self, collection, doc_id):
+        self._count("get")
+        doc = self._db().collection(collection).document(doc_id).get()
+        return doc.to_dict() if doc.exists else None
+
+    def update(self, collection, doc_id, data):
+        from google.api_core.exceptions import NotFound
+        self._count("update")
+        try:
+            self._db().collection(collection).document(doc_id).update({
+                self._field_path(key): self._value(value) for key, value in data.items()
+            })
+        except NotFound as e:
+            raise DocumentNotFoundError(f"{collection}/{doc_id}") from e
+
+    def delete(self, collection, doc_id):
+        self._count("delete")
+        self._db().collection(collection).document(doc_id).delete()
+
+    def query(self, collection, filters=(), order_by=(), limit=None, start_after=None):
+        from google.api_core.exceptions import FailedPrecondition
+        self._count("query")
+        query = self._db().collection(collection)
+        for field, operator, value in filters:
+            query = query.where(field, operator, value)
+        for field, direction in order_by:
+            query = query.order_by(field, direction=direction)
+        if start_after:
+            query = query.start_after(start_after)
+        if limit is not None:
+            query = query.limit(limit)
+        try:
+            return [doc.to_dict() for doc in query.stream()]
+        except FailedPrecondition as e:
+            raise MissingIndexError(str(e)) from e
+
+    def get_many(self, collection, doc_ids):
+        self._count("get_many")
+        if not doc_ids:
+            return {}
+        db = self._db()
+        refs = [db.collection(collection).document(doc_id) for doc_id in dict.fromkeys(doc_ids)]
+        return {snapshot.id: snapshot.to_dict() for snapshot in db.get_all(refs) if snapshot.exists}
+
+    def update_if_greater(self, collection, field, values, data=None):
+        from firebase_admin import firestore
+        db = self._db()
+        items = list(values.items())
+        missing: List[str] = []
+        # A transaction reads every document first, and is retried if one changes before the commit
+        for start in range(0, len(items), 500):
+            chunk = items[start:start + 500]
+            self._count("transaction")
+
+            @firestore.transactional
+            def advance(transaction) -> List[str]:
+                refs = [db.collection(collection).document(doc_id) for doc_id, _ in chunk]
+                snapshots = {snapshot.id: snapshot for snapshot in db.get_all(refs, transaction=transaction)}
+                absent = []
+                for ref, (doc_id, value) in zip(refs, chunk):
+                    snapshot = snapshots.get(doc_id)
+                    if snapshot is None or not snapshot.exists:
+                        absent.append(doc_id)
+                    elif _is_greater(value, (snapshot.to_dict() or {}).get(field)):
+                        transaction.update(ref, {**(data or {}), field: value})
+                return absent
+            missing.extend(advance(db.transaction()))
+        return missing
+
+    def batch_write(self, operations):
+        from google.api_core.exceptions import NotFound
+        db = self._db()
+        # Firestore caps a batch at 500 writes
+        for start in range(0, len(operations), 500):
+            self._count("batch_write")
+            batch = db.batch()
+            for operation, collection, doc_id, data in operations[start:start + 500]:
+                ref = db.collection(collection).document(doc_id)
+                if operation == "set":
+                    batch.set(ref, data)
+                elif operation == "merge":
+                    batch.set(ref, {self._field_path(k): self._value(v) for k, v in data.items()}, merge=True)
+                elif operation == "update":
+                    batch.update(ref, {self._field_path(k): self._value(v) for k, v in data.items()})
+                elif operation == "delete":
+                    batch.delete(ref)
+                else:
+                    raise ValueError(f"Unsupported write operation: {operation}")
+            try:
+                batch.commit()
+            except NotFound as e:
+                raise DocumentNotFoundError(str(e)) from e
+
+# ---------------------------------------------------------------------------
+# Shared in-process query evaluation
+# ---------------------------------------------------------------------------
+
+_MISSING = object()
+
+def _split_path(key: FieldKey) -> Tuple[str, ...]:
+    return key if isinstance(key, tuple) else tuple(key.split("."))
+
+def _lookup(doc: Dict[str, Any], field: str) -> Any:
+    value: Any = doc
+    for part in field.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+def _compare(left: Any, right: Any) -> int:
+    try:
+        return (left > right) - (left < right)
+    except TypeError:
+        # Values of different types: order by type name, as Firestore orders by type first
+        return _compare(type(left).__name__, type(right).__name__)
+
+def _matches(doc: Dict[str, Any], field: str, operator: str, value: Any) -> bool:
+    actual = _lookup(doc, field)
+    if actual is _MISSING:
+        # Firestore never matches documents that lack the filtered field
+        return False
+    if operator == "==":
+        return actual == value
+    if operator == "!=":
+        return actual != value
+    if operator == "in":
+        return actual in value
+    if operator == "not-in":
+        return actual not in value
+    if operator == "array_contains":
+        return isinstance(actual, list) and value in actual
+    if operator == "array_contains_any":
+        return isinstance(actual, list) and any(item in actual for item in value)
+    try:
+        if operator == "<":
+            return actual < value
+        if operator == "<=":
+            return actual <= value
+        if operator == ">":
+            return actual > value
+        if operator == ">=":
+            return actual >= value
+    except TypeError:
+        return False
+    raise ValueError(f"Unsupported operator: {operator}")
+
+def _compare_positions(doc: Dict[str, Any], position: Dict[str, Any], order_by: Sequence[OrderBy]) -> int:
+    for field, direction in order_by:
+        result = _compare(_lookup(doc, field), position.get(field))
+        if result:
+            return -result if direction == DESCENDING else result
+    return 0
+
+def run_query(
+    docs: Iterable[Dict[str, Any]],
+    filters: Sequence[Filter] = (),
+    order_by: Sequence[OrderBy] = (),
+    limit: Optional[int] = None,
+    start_after: Optional[Dict[str, Any]] = None
+) -> List[Dict[str, Any]]:
+    """Evaluate a query over plain documents with Firestore's semantics"""
+    results = [doc for doc in docs if all(_matches(doc, *condition) for condition in filters)]
+    # Firestore excludes documents that lack an order_by field
+    results = [doc for doc in results if all(_lookup(doc, field) is not _MISSING for field, _ in order_by)]
+    for field, direction in reversed(order_by):
+        results.sort(key=lambda doc: _SortKey(_lookup(doc, field)), reverse=direction == DESCENDING)
+    if start_after:
+        results = [doc for doc in results if _compare_positions(doc, start_after, order_by) > 0]
+    if limit is not None:
+        results = results[:limit]
+    return results
+
+class _SortKey:
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return _compare(self.value, other.value) < 0
+
+def apply_writes(read, write, remove, operations: Sequence[WriteOperation]):
+    """Validate then apply a batch through per-document read/write/remove callables"""
+    pending: Dict[Tuple[str, str], Optional[Dict[str, Any]]] = {}
+    for operation, collection, doc_id, data in operations:
+        key = (collection, doc_id)
+        doc = pending[key] if key in pending else read(collection, doc_id)
+        if operation == "set":
+            doc = copy.deepcopy(data)
+        elif operation in ("merge", "update"):
+            if doc is None:
+                if operation == "update":
+                    raise DocumentNotFoundError(f"{collection}/{doc_id}")
+                doc = {}
+            else:
+                doc = copy.deepcopy(doc)
+            apply_update(doc, data)
+        elif operation == "delete":
+            doc = None
+        else:
+            raise ValueError(f"Unsupported write operation: {operation}")
+        pending[key] = doc
+    for (collection, doc_id), doc in pending.items():
+        if doc is None:
+            remove(collection, doc_id)
+        else:
+            write(collection, doc_id, doc)
+
+def _is_greater(value: Any, current: Any) -> bool:
+    if current is None:
+        return True
+    if isinstance(value, datetime) and isinstance(current, datetime):
+        # Firestore returns aware datetimes while the app writes naive UTC
+        value, current = (
+            moment.astimezone(timezone.utc).replace(tzinfo=None) if moment.tzinfo else moment
+            for moment in (value, current)
+        )
+    return value > current
+
+def apply_maximum(read, write, collection: str, field: str, values: Dict[str, Any], data) -> List[str]:
+    """update_if_greater through per-document read/write callables (the caller holds the lock)"""
+    missing = []
+    for doc_id, value in values.items():
+        doc = read(collection, doc_id)
+        if doc is None:
+            missing.append(doc_id)
+        elif _is_greater(value, doc.get(field)):
+            apply_update(doc, {**(data or {}), field: value})
+            write(collection, doc_id, doc)
+    return missing
+
+def apply_update(doc: Dict[str, Any], data: Dict[FieldKey, Any]):
+    """Apply an update (including nested paths and array transforms) to a plain document"""
+    for key, value in data.items():
+        path = _split_path(key)
+        target = doc
+        for part in path[:-1]:
+            child = target.get(part)
+            if not isinstance(child, dict):
+                child = {}
+                target[part] = child
+            target = child
+        field = path[-1]
+        if isinstance(value, ArrayUnion):
+            current = list(target.get(field) or [])
+            current.extend(item for item in value.values if item not in current)
+            target[field] = current
+        elif isinstance(value, ArrayRemove):
+            target[field] = [item for item in (target.get(field) or []) if item not in value.values]
+        else:
+            target[field] = copy.deepcopy(value)
+
+# ---------------------------------------------------------------------------
+# In-memory
+# ---------------------------------------------------------------------------
+
+class InMemoryBackend(StorageBackend):
+    """Process-local dict storage; deterministic and dependency-free"""
+
+    name = "memory"
+
+    def __init__(self):
+        super().__init__()
+        self._collections: Dict[str, Dict[str, Dict[str, Any]]] = defaultdict(dict)
+        self._lock = threading.RLock()
+
+    def set(self, collection, doc_id, data):
+        self._count("set")
+        with self._lock:
+            self._collections[collection][doc_id] = copy.deepcopy(data)
+
+    def get(self, collection, doc_id):
+        self._count("get")
+        with self._lock:
+            doc = self._collections[collection].get(doc_id)
+            return copy.deepcopy(doc) if doc is not None else None
+
+    def update(self, collection, doc_id, data):
+        self._count("update")
+        with self._lock:
+            doc = self._collections[collection].get(doc_id)
+            if doc is None:
+                raise DocumentNotFoundError(f"{collection}/{doc_id}")
+            apply_update(doc, data)
+
+    def delete(self, collection, doc_id):
+        self._count("delete")
+        with self._lock:
+            self._collections[collection].pop(doc_id, None)
+
+    def query(self, collection, filters=(), order_by=(), limit=None, start_after=None):
+        self._count("query")
+        with self._lock:
+            results = run_query(self._collections[collection].values(), filters, order_by, limit, start_after)
+            return copy.deepcopy(results)
+
+    def get_many(self, collection, doc_ids):
+        self._count("get_many")
+        with self._lock:
+            docs = self._collections[collection]
+            return {doc_id: copy.deepcopy(docs[doc_id]) for doc_id in doc_ids if doc_id in docs}
+
+    def batch_write(self, operations):
+        self._count("batch_write")
+        with self._lock:
+            apply_writes(
+                lambda collection, doc_id: self._collections[collection].get(doc_id),
+                lambda collection, doc_id, doc: self._collections[collection].__setitem__(doc_id, doc),
+                lambda collection, doc_id: self._collections[collection].pop(doc_id, None),
+                operations
+            )
+
+    def update_if_greater(self, collection, field, values, data=None):
+        self._count("update_if_greater")
+        with self._lock:
+            return apply_maximum(
+                lambda collection, doc_id: self._collections[collection].get(doc_id),
+                lambda collection, doc_id, doc: self._collections[collection].__setitem__(doc_id, doc),
+                collection, field, values, data
+            )
+
+    def clear(self):
+        """Drop all data (useful between benchmark runs)"""
+        with self._lock:
+            self._collections.clear()
+            self.operation_counts.clear()
+
+# ---------------------------------------------------------------------------
+# SQLite
+# ---------------------------------------------------------------------------
+
+def _encode(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def _decode(obj: Dict[str, Any]) -> Any:
+    if set(obj) == {"__datetime__"}:
+        return datetime.fromisoformat(obj["__datetime__"])
+    return obj
+
+class SQLiteBackend(StorageBackend):
+    """Single-file SQLite storage; documents are stored as JSON and queried in-process"""
+
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.RLock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                "collection TEXT NOT NULL, doc_id TEXT NOT NULL, data TEXT NOT NULL, "
+                "PRIMARY KEY (collection, doc_id))"
+            )
+
+    def _dumps(self, data: Dict[str, Any]) -> str:
+        return json.dumps(data, default=_encode)
+
+    def _loads(self, raw: str) -> Dict[str, Any]:
+        return json.loads(raw, object_hook=_decode)
+
+    def _read(self, collection: str, doc_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn.execute(
+            "SELECT data FROM documents WHERE collection = ? AND doc_id = ?", (collection, doc_id)
+        ).fetchone()
+        return self._loads(row[0]) if row else None
+
+    def _write(self, collection: str, doc_id: str, data: Dict[str, Any]):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO documents (collection, doc_id, data) VALUES (?, ?, ?)",
+            (collection, doc_id, self._dumps(data))
+        )
+
+    def set(self, collection, doc_id, data):
+        self._count("set")
+        with self._lock, self._conn:
+            self._write(collection, doc_id, data)
+
+    def get(self, collection, doc_id):
+        self._count("get")
+        with self._lock:
+            return self._read(collection, doc_id)
+
+    def update(self, collection, doc_id, data):
+        self._count("update")
+        with self._lock, self._conn:
+            doc = self._read(collection, doc_id)
+            if doc is None:
+                raise DocumentNotFoundError(f"{collection}/{doc_id}")
+            apply_update(doc, data)
+            self._write(collection, doc_id, doc)
+
+    def delete(self, collection, doc_id):
+        self._count("delete")
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM documents WHERE collection = ? AND doc_id = ?", (collection, doc_id)
+            )
+
+    def query(self, collection, filters=(), order_by=(), limit=None, start_after=None):
+        self._count("query")
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT data FROM documents WHERE collection = ?", (collection,)
+            ).fetchall()
+        return run_query((self._loads(row[0]) for row in rows), filters, order_by, limit, start_after)
+
+    def get_many(self, collection, doc_ids):
+        self._count("get_many")
+        with self._lock:
+            docs = {doc_id: self._read(collection, doc_id) for doc_id in doc_ids}
+        return {doc_id: doc for doc_id, doc in docs.items() if doc is not None}
+
+    def batch_write(self, operations):
+        self._count("batch_write")
+        with self._lock, self._conn:
+            apply_writes(
+                self._read,
+                self._write,
+                lambda collection, doc_id: self._conn.execute(
+                    "DELETE FROM documents WHERE collection = ? AND doc_id = ?", (collection, doc_id)
+                ),
+                operations
+            )
+
+    def update_if_greater(self, collection, field, values, data=None):
+        self._count("update_if_greater")
+        with self._lock, self._conn:
+            return apply_maximum(self._read, self._write, collection, field, values, data)
+
+# ---------------------------------------------------------------------------
+# Selection
+# ---------------------------------------------------------------------------
+
+_storage: Optional[StorageBackend] = None
+_storage_lock = threading.Lock()
+
+def create_storage(backend: str = STORAGE_BACKEND) -> StorageBackend:
+    """Build a backend by name"""
+    if backend == "firestore":
+        from app.config import db
+        return FirestoreBackend(db)
+    if backend == "memory":
+        return InMemoryBackend()
+    if backend == "sqlite":
+        return SQLiteBackend(SQLITE_DB_PATH)
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+
+def get_storage() -> StorageBackend:
+    """Get the process-wide storage backend selected by configuration"""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                _storage = create_storage()
+                from app.services.metrics_service import register_provider
+                register_provider("storage", lambda: _storage.stats())
+    return _storage
+
+def set_storage(storage: StorageBackend):
+    """Replace the process-wide backend (e.g. an InMemoryBackend in benchmarks)"""
+    global _storage
+    _storage = storage
@@ -0,0 +1,95 @@
+"""
+Debounced writes of teams/{team_id}.last_message_at.
+
+Every message used to update its team document, which turns busy teams into write
+hot-spots (Firestore sustains roughly one write per second per document). Messages now
+only record the timestamp in memory; a background task writes each changed team at most
+once per LAST_MESSAGE_AT_WRITE_INTERVAL, in a single transaction. Each worker holds its own
+latest value, so the write only ever moves the stored timestamp forward.
+"""
+import asyncio
+from datetime import datetime
+from typing import Any, Dict, Optional, Set
+from app.config import LAST_MESSAGE_AT_WRITE_INTERVAL
+from app.services.async_firestore_service import advance_field
+from app.services.firestore_service import message_timestamp
+from app.services.metrics_service import register_provider
+
+class LastMessageAtUpdater:
+    """Keeps each team's exact last_message_at in memory and persists it on an interval"""
+
+    def __init__(self, interval: float = LAST_MESSAGE_AT_WRITE_INTERVAL):
+        self.interval = interval
+        self.latest: Dict[str, datetime] = {}
+        self.writes = 0
+        self.coalesced = 0
+        self._dirty: Set[str] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    def touch(self, team_id: str, timestamp: datetime):
+        """Record a new message in a team (starts the writer on first use)"""
+        current = self.latest.get(team_id)
+        if current is None or timestamp > current:
+            self.latest[team_id] = timestamp
+        if team_id in self._dirty:
+            self.coalesced += 1
+            return
+        self._dirty.add(team_id)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def get(self, team_id: str) -> Optional[datetime]:
+        """Latest message time seen by this process, which may be ahead of Firestore"""
+        return self.latest.get(team_id)
+
+    def apply(self, team: Dict[str, Any]) -> Dict[str, Any]:
+        """Overlay the in-memory last_message_at on a team document that may not have it yet"""
+        latest = self.latest.get(team.get("teamId"))
+        stored = team.get("last_message_at")
+        # Firestore returns aware datetimes while the in-memory value is naive UTC
+        if latest is not None and (stored is None or message_timestamp(latest) > message_timestamp(stored)):
+            team["last_message_at"] = latest
+        return team
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    async def flush(self):
+        """Write every team touched since the last flush"""
+        if not self._dirty:
+            return
+        team_ids = list(self._dirty)
+        self._dirty.clear()
+        try:
+            # Never moves the stored value back (another worker may have written a later message)
+            missing = await advance_field("teams", "last_message_at", {team_id: self.latest[team_id] for team_id in team_ids})
+            self.writes += len(team_ids) - len(missing)
+            # Deleted teams
+            for team_id in missing:
+                self.latest.pop(team_id, None)
+        except Exception as e:
+            print(f"Error updating last_message_at for {len(team_ids)} teams: {e}")
+            self._dirty.update(team_ids)
+
+    async def stop(self):
+        """Stop the background task and write what is still pending"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending_teams": len(self._dirty),
+            "writes": self.writes,
+            "coalesced": self.coalesced
+        }
+
+last_message_at_updater = LastMessageAtUpdater()
+register_provider("last_message_at", last_message_at_updater.stats)
@@ -0,0 +1,41 @@
+from typing import Dict, Any, Optional
+from app.config import TEAM_MEMBERSHIP_CACHE_SIZE, TEAM_MEMBERSHIP_CACHE_TTL
+from app.services.cache_service import TTLCache
+from app.services.metrics_service import register_provider
+
+# team_id -> {"team_id", "admin_id", "member_ids"}; only existing teams are cached
+team_membership_cache = TTLCache(
+    max_size=TEAM_MEMBERSHIP_CACHE_SIZE,
+    ttl_seconds=TEAM_MEMBERSHIP_CACHE_TTL
+)
+register_provider("team_membership_cache", team_membership_cache.stats)
+
+def build_membership(team: Dict[str, Any]) -> Dict[str, Any]:
+    """Reduce a team document to what authorization checks need"""
+    from app.services.firestore_service import build_member_ids
+    member_ids = team.get("member_ids") or build_member_ids(team.get("admin_id"), team.get("members", []))
+    return {
+        "team_id": team.get("teamId"),
+        "admin_id": team.get("admin_id"),
+        "member_ids": frozenset(member_ids)
+    }
+
+async def get_team_membership(team_id: str) -> Optional[Dict[str, Any]]:
+    """Get a team's membership, reading Firestore only on a cache miss"""
+    membership = team_membership_cache.get(team_id)
+    if membership is None:
+        from app.services.async_firestore_service import get_document
+        team = await get_document("teams", team_id)
+        if not team:
+            return None
+        membership = build_membership(team)
+        team_membership_cache.set(team_id, membership)
+    return membership
+
+def is_team_member(membership: Dict[str, Any], user_id: str) -> bool:
+    """Check whether a user is the admin or a member of a team"""
+    return membership["admin_id"] == user_id or user_id in membership["member_ids"]
+
+def invalidate_team_membership(team_id: str):
+    """Forget cached membership after the team's admin or members change"""
+    team_membership_cache.invalidate(team_id)
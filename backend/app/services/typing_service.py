@@ -0,0 +1,170 @@
+"""
+Server-side throttling and coalescing of typing indicators.
+
+Clients send a typing frame on (almost) every keystroke. Instead of re-broadcasting each one,
+the coordinator accepts at most one state change per user per TYPING_THROTTLE_INTERVAL and
+publishes a single typing_state frame per room (the users currently typing) at most every
+TYPING_BROADCAST_INTERVAL, and only when that set changed.
+
+Each worker only sees its own connections, so its frames carry just its local typers. Every
+worker keeps the latest snapshot received from each origin worker (via the broker) and hands
+its clients the union, so users typing on different workers don't overwrite each other.
+Snapshots are republished while anyone is typing and expire after TYPING_TIMEOUT, which also
+clears the typers of a worker that went away.
+"""
+import asyncio
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from app.config import TYPING_THROTTLE_INTERVAL, TYPING_BROADCAST_INTERVAL, TYPING_TIMEOUT
+
+class TypingState:
+    """One user's typing state in one room"""
+
+    def __init__(self, user: Dict[str, Any], now: float):
+        self.user = user
+        self.is_typing = False
+        self.changed_at = now - TYPING_THROTTLE_INTERVAL
+        self.expires_at = now
+        # Latest state received while throttled, applied once the interval has passed
+        self.pending: Optional[bool] = None
+
+class TypingCoordinator:
+    """Tracks who is typing per room and publishes coalesced typing_state frames"""
+
+    def __init__(self, broadcast: Callable[[str, Dict[str, Any]], Awaitable[None]]):
+        self.broadcast = broadcast
+        self.rooms: Dict[str, Dict[str, TypingState]] = {}
+        # Latest non-empty snapshot per team per origin worker, with its expiry
+        self.snapshots: Dict[str, Dict[str, Tuple[List[Dict[str, Any]], float]]] = {}
+        self._published: Dict[str, float] = {}
+        self.received = 0
+        self.dropped = 0
+        self.broadcasts = 0
+        self._dirty: Set[str] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    def update(self, team_id: str, user_info: Dict[str, Any], is_typing: bool):
+        """Record a typing frame from a client (starts the publisher on first use)"""
+        self.received += 1
+        now = time.monotonic()
+        user_id = user_info.get("uid")
+        room = self.rooms.setdefault(team_id, {})
+        state = room.get(user_id)
+        if state is None:
+            state = room[user_id] = TypingState({
+                "uid": user_id,
+                "name": user_info.get("name", user_info.get("email", "").split("@")[0]),
+                "email": user_info.get("email")
+            }, now)
+        if is_typing:
+            state.expires_at = now + TYPING_TIMEOUT
+
+        if is_typing == state.is_typing:
+            # Keep-alive or repeat (cancelling any throttled change): nothing to publish
+            self.dropped += 1 if state.pending is None else 2
+            state.pending = None
+        elif now - state.changed_at >= TYPING_THROTTLE_INTERVAL:
+            self._apply(team_id, state, is_typing, now)
+        else:
+            if state.pending is not None:
+                # Superseded before it was ever published
+                self.dropped += 1
+            state.pending = is_typing
+
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def remove_user(self, team_id: str, user_id: str):
+        """Stop showing a user as typing (e.g. their last connection to the room closed)"""
+        state = self.rooms.get(team_id, {}).pop(user_id, None)
+        if state is not None and state.is_typing:
+            self._dirty.add(team_id)
+
+    def _apply(self, team_id: str, state: TypingState, is_typing: bool, now: float):
+        state.is_typing = is_typing
+        state.changed_at = now
+        state.pending = None
+        self._dirty.add(team_id)
+
+    def merge(self, team_id: str, origin: str, frame: Dict[str, Any]) -> Dict[str, Any]:
+        """Record a worker's typing_state snapshot and return the frame with every worker's typers"""
+        now = time.monotonic()
+        snapshots = self.snapshots.setdefault(team_id, {})
+        if frame.get("users"):
+            snapshots[origin] = (frame["users"], now + TYPING_TIMEOUT)
+        else:
+            snapshots.pop(origin, None)
+        users: Dict[str, Dict[str, Any]] = {}
+        for key, (snapshot_users, expires_at) in list(snapshots.items()):
+            if expires_at <= now:
+                del snapshots[key]
+                continue
+            for user in snapshot_users:
+                users.setdefault(user["uid"], user)
+        if not snapshots:
+            del self.snapshots[team_id]
+        return {**frame, "users": list(users.values())}
+
+    def _tick(self, now: float):
+        for team_id, room in list(self.rooms.items()):
+            for user_id, state in list(room.items()):
+                if state.pending is not None and now - state.changed_at >= TYPING_THROTTLE_INTERVAL:
+                    self._apply(team_id, state, state.pending, now)
+                elif state.is_typing and now >= state.expires_at:
+                    self._apply(team_id, state, False, now)
+                elif not state.is_typing and state.pending is None and now - state.changed_at >= TYPING_THROTTLE_INTERVAL:
+                    del room[user_id]
+            if not room:
+                del self.rooms[team_id]
+            elif any(state.is_typing for state in room.values()) and \
+                    now - self._published.get(team_id, now) >= TYPING_TIMEOUT / 2:
+                # Refresh the snapshot before other workers expire it
+                self._dirty.add(team_id)
+        for team_id, snapshots in list(self.snapshots.items()):
+            for origin, (_, expires_at) in list(snapshots.items()):
+                if expires_at <= now:
+                    del snapshots[origin]
+            if not snapshots:
+                del self.snapshots[team_id]
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(TYPING_BROADCAST_INTERVAL)
+            self._tick(time.monotonic())
+            dirty, self._dirty = self._dirty, set()
+            for team_id in dirty:
+                room = self.rooms.get(team_id, {})
+                users = [state.user for state in room.values() if state.is_typing]
+                if users:
+                    self._published[team_id] = time.monotonic()
+                else:
+                    self._published.pop(team_id, None)
+                self.broadcasts += 1
+                try:
+                    # This worker's typers only; receivers merge it with other workers' (see merge)
+                    await self.broadcast(team_id, {
+                        "type": "typing_state",
+                        "team_id": team_id,
+                        "users": users,
+                        "timestamp": datetime.utcnow().isoformat()
+                    })
+                except Exception as e:
+                    print(f"Error broadcasting typing state for team {team_id}: {e}")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active_rooms": len(self.rooms),
+            "frames_received": self.received,
+            "frames_dropped": self.dropped,
+            "broadcasts": self.broadcasts
+        }
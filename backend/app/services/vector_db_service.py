@@ -1,22 +1,56 @@
 import chromadb
 from chromadb.config import Settings
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import os
 from datetime import datetime
+from app.config import CHROMA_DB_PATH, VECTOR_REINDEX_BATCH_SIZE, VECTOR_INDEX_MIN_CHARS
+from app.services.embedding_service import embedding_service
 
-# Initialize ChromaDB client
-chroma_client = chromadb.Client(Settings(
-    anonymized_telemetry=False,
-    allow_reset=True
-))
+MESSAGES_COLLECTION = "team_messages"
+
+_chroma_client = None
+_messages_collection = None
+
+def get_chroma_client():
+    """Process-wide persistent ChromaDB client at CHROMA_DB_PATH (shared with chroma_service)"""
+    global _chroma_client
+    if _chroma_client is None:
+        _chroma_client = chromadb.PersistentClient(
+            path=CHROMA_DB_PATH,
+            settings=Settings(
+                anonymized_telemetry=False,
+                allow_reset=True
+            )
+        )
+    return _chroma_client
 
 # Get or create collection for messages
 def get_messages_collection():
-    """Get or create the messages collection"""
-    return chroma_client.get_or_create_collection(
-        name="team_messages",
-        metadata={"description": "Team chat messages for RAG context"}
-    )
+    """Get or create the messages collection (vectors come from embedding_service)"""
+    global _messages_collection
+    if _messages_collection is None:
+        _messages_collection = get_chroma_client().get_or_create_collection(
+            name=MESSAGES_COLLECTION,
+            embedding_function=None,
+            metadata={"description": "Team chat messages for RAG context"}
+        )
+    return _messages_collection
+
+def message_metadata(message: Dict[str, Any]) -> Dict[str, Any]:
+    """Vector store metadata for a stored chat message"""
+    created_at = message.get("created_at")
+    return {
+        "team_id": message.get("teamId", ""),
+        "sender_name": message.get("sender_name") or "Unknown",
+        "sender_id": message.get("senderId", ""),
+        "timestamp": created_at.isoformat() if isinstance(created_at, datetime) else str(created_at or ""),
+        "message_type": message.get("message_type", "text")
+    }
+
+def is_indexable(message: Dict[str, Any]) -> bool:
+    """Only text messages with content (at least VECTOR_INDEX_MIN_CHARS of it) are embedded"""
+    content = (message.get("content") or "").strip()
+    return message.get("message_type", "text") == "text" and bool(content) and len(content) >= VECTOR_INDEX_MIN_CHARS
 
 def add_message_to_vector_db(message_id: str, content: str, metadata: Dict[str, Any]):
     """
@@ -33,6 +67,7 @@ def add_message_to_vector_db(message_id: str, content: str, metadata: Dict[str,
         # Add document to collection
         collection.add(
             documents=[content],
+            embeddings=embedding_service.embed_documents([content]),
             metadatas=[metadata],
             ids=[message_id]
         )
@@ -57,7 +92,7 @@ def add_messages_batch(messages: List[Dict[str, Any]]):
         metadatas = []
         
         for msg in messages:
-            if msg.get('content') and msg.get('message_type') == 'text':
+            if msg.get('message_type') == 'text' and is_indexable(msg):
                 ids.append(msg['message_id'])
                 documents.append(msg['content'])
                 metadatas.append({
@@ -71,6 +106,7 @@ def add_messages_batch(messages: List[Dict[str, Any]]):
         if ids:
             collection.add(
                 documents=documents,
+                embeddings=embedding_service.embed_documents(documents),
                 metadatas=metadatas,
                 ids=ids
             )
@@ -80,6 +116,19 @@ def add_messages_batch(messages: List[Dict[str, Any]]):
         print(f"Error adding messages batch to vector DB: {str(e)}")
         return 0
 
+def index_messages(messages: List[Dict[str, Any]]) -> int:
+    """Embed and upsert stored message documents (idempotent, so batches can be retried)"""
+    messages = [message for message in messages if is_indexable(message)]
+    if messages:
+        documents = [message["content"] for message in messages]
+        get_messages_collection().upsert(
+            ids=[message["messageId"] for message in messages],
+            documents=documents,
+            embeddings=embedding_service.embed_documents(documents),
+            metadatas=[message_metadata(message) for message in messages]
+        )
+    return len(messages)
+
 def search_relevant_context(query: str, team_id: str = None, n_results: int = 5) -> List[Dict[str, Any]]:
     """
     Search for relevant messages based on query
@@ -102,7 +151,7 @@ def search_relevant_context(query: str, team_id: str = None, n_results: int = 5)
         
         # Query the collection
         results = collection.query(
-            query_texts=[query],
+            query_embeddings=[embedding_service.embed_query(query)],
             n_results=n_results,
             where=where_filter if where_filter else None
         )
@@ -159,8 +208,49 @@ def get_collection_stats():
         
         return {
             "total_messages": count,
-            "collection_name": "team_messages"
+            "collection_name": MESSAGES_COLLECTION
         }
     except Exception as e:
         print(f"Error getting collection stats: {str(e)}")
-        return {"total_messages": 0, "collection_name": "team_messages"}
+        return {"total_messages": 0, "collection_name": MESSAGES_COLLECTION}
+
+def check_vector_store() -> Dict[str, Any]:
+    """
+    Open the persistent store and read from it once, so a missing or corrupt CHROMA_DB_PATH
+    fails at startup rather than on the first assistant request. Also reports whether the
+    store is empty while Firestore already holds messages (i.e. it needs a reindex).
+    """
+    from app.services.storage_service import get_storage
+
+    collection = get_messages_collection()
+    count = collection.count()
+    if count:
+        collection.get(limit=1, include=["metadatas"])
+    needs_reindex = False
+    storage = get_storage()
+    if count == 0 and storage.available:
+        needs_reindex = bool(storage.query("messages", limit=1))
+    return {"path": os.path.abspath(CHROMA_DB_PATH), "messages": count, "needs_reindex": needs_reindex}
+
+def reindex_messages(batch_size: int = VECTOR_REINDEX_BATCH_SIZE, reset: bool = False) -> int:
+    """
+    Rebuild the message index from Firestore, one team at a time, upserting in batches of
+    `batch_size`. With reset, previously indexed chat messages are removed first (project
+    and code knowledge entries are kept). Returns the number of messages indexed; storage
+    errors are raised rather than ending a team's history early.
+    """
+    from app.services.storage_service import get_storage
+    from app.services.firestore_service import query_team_messages_page, encode_message_cursor
+
+    if reset:
+        get_messages_collection().delete(where={"message_type": "text"})
+
+    # Forward paging from before the oldest possible message
+    start = encode_message_cursor({"created_at": datetime(1970, 1, 1), "messageId": ""})
+    indexed = 0
+    for team in get_storage().query("teams"):
+        cursor: Optional[str] = start
+        while cursor is not None:
+            messages, cursor = query_team_messages_page(team["teamId"], batch_size, after=cursor)
+            indexed += index_messages(messages)
+    return indexed
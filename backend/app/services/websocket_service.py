@@ -1,70 +1,322 @@
-from fastapi import WebSocket, WebSocketDisconnect, Depends, HTTPException
-from typing import List, Dict
+from fastapi import WebSocket, WebSocketDisconnect
+from typing import Callable, Deque, List, Dict, Optional, Set, Tuple
+from collections import deque
 import json
 import asyncio
+from app.config import (
+    WEBSOCKET_SEND_TIMEOUT, WEBSOCKET_SEND_QUEUE_SIZE, WEBSOCKET_OVERFLOW_POLICY, CHAT_WRITE_BEHIND,
+    PRESENCE_REFRESH_INTERVAL
+)
 from app.dependencies.auth import get_current_user_websocket
-from app.services.firestore_service import create_document, get_document, update_document, get_team_messages
-from app.models.message import Message, MessageCreate, MessageStatus
+from app.services.team_membership_service import get_team_membership, is_team_member
+from app.services.metrics_service import register_provider
+from app.services.pubsub_service import PubSubBroker, InProcessBroker, create_broker
+from app.services.message_writer_service import message_writer
+from app.services.message_indexer_service import message_indexer
+from app.services.team_activity_service import last_message_at_updater
+from app.services.message_buffer_service import message_buffer
+from app.services.typing_service import TypingCoordinator
+from app.services.presence_service import PresenceTracker, create_presence_store
+from app.services.async_firestore_service import create_document
+from app.models.message import Message, MessageStatus
 from datetime import datetime
 import uuid
 
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def dumps_message(message: Dict) -> str:
+    """Serialize an outgoing WebSocket frame (datetimes become ISO strings)"""
+    return json.dumps(message, default=_json_default)
+
+# Identifies this worker in pub/sub envelopes
+WORKER_ID = uuid.uuid4().hex
+
+# Broadcast frames that change buffered messages (see message_buffer_service.apply_event)
+BUFFERED_FRAME_TYPES = {"new_message", "message_updated", "message_deleted", "reaction_added", "reaction_removed"}
+
+# Frames that may be discarded when a client falls behind; everything else is delivered or the client is dropped
+DROPPABLE_FRAME_TYPES = {"typing", "typing_state"}
+
+class ConnectionRecord:
+    """One WebSocket with its team, user and bounded outbound queue drained by its own writer task"""
+
+    def __init__(self, websocket: WebSocket, team_id: str, user_info: Dict, on_failure: Callable[["ConnectionRecord"], None]):
+        self.websocket = websocket
+        self.team_id = team_id
+        self.user_info = user_info
+        self.on_failure = on_failure
+        # Identifies the connection in pub/sub envelopes (e.g. to exclude the sender)
+        self.connection_id = uuid.uuid4().hex
+        self.frames: Deque[Tuple[str, bool]] = deque()
+        self.dropped = 0
+        self._ready = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def depth(self) -> int:
+        return len(self.frames)
+
+    def start(self):
+        self._task = asyncio.create_task(self._write_loop())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+
+    def offer(self, payload: str, droppable: bool = False) -> bool:
+        """Queue a frame without blocking; returns False when the client must be disconnected"""
+        if len(self.frames) >= WEBSOCKET_SEND_QUEUE_SIZE:
+            if WEBSOCKET_OVERFLOW_POLICY != "drop_typing":
+                return False
+            if droppable:
+                self.dropped += 1
+                return True
+            # Make room by discarding the oldest queued droppable frame
+            for index, (_, queued_droppable) in enumerate(self.frames):
+                if queued_droppable:
+                    del self.frames[index]
+                    self.dropped += 1
+                    break
+            else:
+                return False
+        self.frames.append((payload, droppable))
+        self._ready.set()
+        return True
+
+    async def _write_loop(self):
+        while True:
+            while not self.frames:
+                self._ready.clear()
+                await self._ready.wait()
+            payload, _ = self.frames.popleft()
+            try:
+                await asyncio.wait_for(self.websocket.send_text(payload), timeout=WEBSOCKET_SEND_TIMEOUT)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.on_failure(self)
+                return
+
 class ConnectionManager:
-    def __init__(self):
-        # Dictionary to store active connections by team_id
-        self.active_connections: Dict[str, List[WebSocket]] = {}
-        # Dictionary to store user info for each connection
-        self.user_connections: Dict[WebSocket, Dict] = {}
+    def __init__(self, broker: Optional[PubSubBroker] = None, worker_id: str = WORKER_ID):
+        # Record for each open socket, and the records in each team room; empty rooms are removed
+        self.connections: Dict[WebSocket, ConnectionRecord] = {}
+        self.rooms: Dict[str, Set[ConnectionRecord]] = {}
+        self.overflow_disconnects = 0
+        # Broadcasts go through the broker so members connected to other workers receive them
+        self.broker = broker or create_broker()
+        # Stamped on published envelopes to recognize this worker's own broadcasts
+        self.worker_id = worker_id
+        # Throttled, coalesced typing indicators
+        self.typing = TypingCoordinator(self.broadcast_to_team)
+        # Online users per team (a user with several tabs counts once); with the Redis broker the
+        # store shares the counts so tabs on other workers count too
+        self.presence = PresenceTracker()
+        self.presence_store = create_presence_store(self.broker, worker_id)
+        self._refresh: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """Start receiving broadcasts for this worker's rooms and refreshing its shared presence"""
+        await self.broker.start(self._deliver_local)
+        if self.presence_store is not None:
+            self._refresh = asyncio.create_task(self._refresh_presence_loop())
+
+    async def stop(self):
+        if self._refresh:
+            self._refresh.cancel()
+            self._refresh = None
+        await self.typing.stop()
+        await self.broker.stop()
+
+    async def _refresh_presence_loop(self):
+        # Dead sockets are closed by the server's WebSocket protocol pings; this only keeps
+        # the shared entries of live ones from expiring
+        while True:
+            await asyncio.sleep(PRESENCE_REFRESH_INTERVAL)
+            try:
+                await self.presence_store.refresh(self.presence.teams)
+            except Exception as e:
+                print(f"Presence refresh failed: {e}")
+
+    async def _share_presence(self, team_id: str, user_id: str) -> bool:
+        """Publish this worker's current state for a user; returns whether they are online on another worker"""
+        if self.presence_store is None:
+            return False
+        try:
+            # Write the state as of now, so a quick reconnect isn't overwritten by the earlier leave
+            return await self.presence_store.update(team_id, user_id, self.presence.entry(team_id, user_id))
+        except Exception as e:
+            print(f"Presence update failed for team {team_id}: {e}")
+            return False
+
+    async def _share_disconnect(self, team_id: str, user_info: Dict, last_local: bool):
+        # Every disconnect updates the shared count; a leave is announced only if no tab remains anywhere
+        if not await self._share_presence(team_id, user_info.get("uid")) and last_local:
+            await self.broadcast_to_team(team_id, {
+                "type": "user_left",
+                "user": user_info,
+                "timestamp": datetime.utcnow().isoformat()
+            })
+
+    async def online_members(self, team_id: str) -> List[Dict]:
+        """Users connected to a team on any worker (this worker's only if the shared store is unavailable)"""
+        if self.presence_store is not None:
+            try:
+                return await self.presence_store.online(team_id)
+            except Exception as e:
+                print(f"Presence lookup failed for team {team_id}: {e}")
+        return self.presence.online(team_id)
 
     async def connect(self, websocket: WebSocket, team_id: str, user_info: Dict):
         """Accept a WebSocket connection and add to team room"""
         await websocket.accept()
         
-        if team_id not in self.active_connections:
-            self.active_connections[team_id] = []
-        
-        self.active_connections[team_id].append(websocket)
-        self.user_connections[websocket] = user_info
+        record = ConnectionRecord(websocket, team_id, user_info, self._evict)
+        self.connections[websocket] = record
+        room = self.rooms.get(team_id)
+        new_room = room is None
+        if new_room:
+            room = self.rooms[team_id] = set()
+        room.add(record)
+        record.start()
+        if new_room:
+            await self.broker.subscribe(team_id)
+            if message_buffer.is_live is not None:
+                # Changes made on other workers before the subscription may be missing from the buffer
+                message_buffer.discard(team_id)
         
-        # Send join notification to other team members
-        await self.broadcast_to_team(team_id, {
-            "type": "user_joined",
-            "user": user_info,
-            "timestamp": datetime.utcnow().isoformat()
-        }, exclude_websocket=websocket)
+        # Every connection updates the shared count; join notifications go to other team members
+        # only for the user's first connection on any worker
+        first_local = self.presence.add(team_id, user_info)
+        if not await self._share_presence(team_id, user_info.get("uid")) and first_local:
+            await self.broadcast_to_team(team_id, {
+                "type": "user_joined",
+                "user": user_info,
+                "timestamp": datetime.utcnow().isoformat()
+            }, exclude_websocket=websocket)
 
     def disconnect(self, websocket: WebSocket):
         """Remove a WebSocket connection"""
-        user_info = self.user_connections.get(websocket)
-        if user_info:
-            # Find which team this connection belongs to
-            for team_id, connections in self.active_connections.items():
-                if websocket in connections:
-                    connections.remove(websocket)
-                    
-                    # Send leave notification to other team members
-                    asyncio.create_task(self.broadcast_to_team(team_id, {
-                        "type": "user_left",
-                        "user": user_info,
-                        "timestamp": datetime.utcnow().isoformat()
-                    }))
-                    break
-            
-            del self.user_connections[websocket]
+        record = self.connections.pop(websocket, None)
+        if record is None:
+            return
+        record.stop()
+
+        team_id = record.team_id
+        room = self.rooms.get(team_id)
+        if room is not None:
+            room.discard(record)
+            if not room:
+                del self.rooms[team_id]
+                if message_buffer.is_live is not None:
+                    # Other workers' changes stop reaching this worker, so the buffer can't be kept current
+                    message_buffer.discard(team_id)
+                asyncio.create_task(self._unsubscribe_if_empty(team_id))
+        
+        # Send leave notification to other team members (only when the user's last connection on any worker closes)
+        user_id = record.user_info.get("uid")
+        last_local = self.presence.remove(team_id, user_id)
+        if last_local:
+            self.typing.remove_user(team_id, user_id)
+        if last_local or self.presence_store is not None:
+            asyncio.create_task(self._share_disconnect(team_id, record.user_info, last_local))
 
     async def send_personal_message(self, message: str, websocket: WebSocket):
         """Send a message to a specific WebSocket connection"""
-        await websocket.send_text(message)
+        record = self.connections.get(websocket)
+        if record is None:
+            await websocket.send_text(message)
+        elif not record.offer(message):
+            self.overflow_disconnects += 1
+            self._evict(record)
+
+    async def _close_quietly(self, websocket: WebSocket):
+        """Close an evicted connection, giving up if the client doesn't respond"""
+        try:
+            await asyncio.wait_for(websocket.close(code=1011), timeout=WEBSOCKET_SEND_TIMEOUT)
+        except Exception:
+            pass
+
+    def _evict(self, record: ConnectionRecord):
+        """Drop a dead, stalled or overflowing connection; closing happens in the background"""
+        if self.connections.get(record.websocket) is record:
+            self.disconnect(record.websocket)
+            asyncio.create_task(self._close_quietly(record.websocket))
+
+    async def _unsubscribe_if_empty(self, team_id: str):
+        # The room may have been reopened between the disconnect and this task running
+        if team_id not in self.rooms:
+            try:
+                await self.broker.unsubscribe(team_id)
+            except Exception as e:
+                print(f"Pub/sub unsubscribe failed for team {team_id}: {e}")
 
     async def broadcast_to_team(self, team_id: str, message: Dict, exclude_websocket: WebSocket = None):
-        """Broadcast a message to all connections in a team"""
-        if team_id in self.active_connections:
-            for connection in self.active_connections[team_id]:
-                if connection != exclude_websocket:
-                    try:
-                        await connection.send_text(json.dumps(message))
-                    except:
-                        # Connection is closed, remove it
-                        self.disconnect(connection)
+        """Broadcast a message to all connections in a team, on every worker"""
+        exclude_record = self.connections.get(exclude_websocket) if exclude_websocket else None
+        envelope = json.dumps({
+            "origin": self.worker_id,
+            "type": message.get("type"),
+            "payload": dumps_message(message),
+            "droppable": message.get("type") in DROPPABLE_FRAME_TYPES,
+            "exclude": exclude_record.connection_id if exclude_record else None
+        })
+        try:
+            await self.broker.publish(team_id, envelope)
+        except Exception as e:
+            # Still reach this worker's sockets if the broker is unavailable
+            print(f"Pub/sub publish failed for team {team_id}: {e}")
+            await self._deliver_local(team_id, envelope)
+
+    async def _deliver_local(self, team_id: str, envelope: str):
+        """Queue a published broadcast on this worker's sockets for the team"""
+        data = json.loads(envelope)
+        payload, droppable, exclude = data["payload"], data["droppable"], data["exclude"]
+        if data.get("type") in BUFFERED_FRAME_TYPES and data.get("origin") != self.worker_id:
+            # Keep this worker's recent-message buffer current with changes made elsewhere
+            message_buffer.apply_event(team_id, json.loads(payload))
+        elif data.get("type") == "typing_state":
+            # Each worker publishes only its own typers; clients get everyone's
+            payload = dumps_message(self.typing.merge(team_id, data["origin"], json.loads(payload)))
+
+        room = self.rooms.get(team_id)
+        if not room:
+            return
+
+        # The frame was serialized once by the publisher; writers send concurrently,
+        # so a slow client only ever backs up its own queue
+        overflowed = [
+            record for record in room
+            if record.connection_id != exclude and not record.offer(payload, droppable)
+        ]
+        # Evict after iterating, since eviction removes records from the room
+        for record in overflowed:
+            self.overflow_disconnects += 1
+            self._evict(record)
+
+    def stats(self) -> Dict:
+        """Connection and room counts, overflow counters and a histogram of queue depths"""
+        # Aggregates only: /metrics is unauthenticated, so no user or team identifiers here
+        bounds = [0, 15, 63, WEBSOCKET_SEND_QUEUE_SIZE - 1]
+        labels = ["0", "1-15", "16-63", f"64-{WEBSOCKET_SEND_QUEUE_SIZE - 1}", "full"]
+        histogram = dict.fromkeys(labels, 0)
+        max_depth = dropped = 0
+        for record in self.connections.values():
+            depth = record.depth
+            histogram[labels[next((i for i, bound in enumerate(bounds) if depth <= bound), len(bounds))]] += 1
+            max_depth = max(max_depth, depth)
+            dropped += record.dropped
+        return {
+            "connections": len(self.connections),
+            "rooms": len(self.rooms),
+            "max_queue_depth": max_depth,
+            "queue_depth_histogram": histogram,
+            "dropped_frames": dropped,
+            "overflow_disconnects": self.overflow_disconnects
+        }
 
     async def broadcast_message_to_team(self, team_id: str, message_data: Dict):
         """Broadcast a chat message to all team members"""
@@ -74,10 +326,34 @@ class ConnectionManager:
             "timestamp": datetime.utcnow().isoformat()
         })
 
+    async def broadcast_message_event_to_team(self, team_id: str, event: Dict):
+        """Broadcast an edit or deletion so clients (and other workers' buffers) can apply it"""
+        await self.broadcast_to_team(team_id, {
+            **event,
+            "timestamp": datetime.utcnow().isoformat()
+        })
+
+    async def broadcast_reaction_to_team(self, team_id: str, event_type: str, message_id: str, emoji: str, user_email: str):
+        """Broadcast a single reaction change so clients can patch the message without refetching"""
+        await self.broadcast_to_team(team_id, {
+            "type": event_type,
+            "message_id": message_id,
+            "emoji": emoji,
+            "user_email": user_email,
+            "timestamp": datetime.utcnow().isoformat()
+        })
+
 manager = ConnectionManager()
+register_provider("websocket", manager.stats)
+register_provider("typing", manager.typing.stats)
+register_provider("presence", manager.presence.stats)
+
+if not isinstance(manager.broker, InProcessBroker):
+    # Other workers' changes reach this one only for teams with a local room, so only those are buffered
+    message_buffer.is_live = lambda team_id: team_id in manager.rooms
 
-async def websocket_endpoint(websocket: WebSocket, team_id: str, token: str):
-    """WebSocket endpoint for real-time chat"""
+async def websocket_endpoint(websocket: WebSocket, team_id: str, token: str, since: Optional[str] = None):
+    """WebSocket endpoint for real-time chat; `since` (last seen messageId or timestamp) requests a delta sync"""
     try:
         # Verify user authentication
         user_info = await get_current_user_websocket(token)
@@ -86,28 +362,34 @@ async def websocket_endpoint(websocket: WebSocket, team_id: str, token: str):
             return
 
         # Verify user is member of the team
-        team = get_document("teams", team_id)
-        if not team:
+        membership = await get_team_membership(team_id)
+        if not membership:
             await websocket.close(code=1008, reason="Team not found")
             return
 
         user_id = user_info.get("uid")
-        is_member = (team.get("admin_id") == user_id or 
-                    any(member.get("user_id") == user_id for member in team.get("members", [])))
-        
-        if not is_member:
+        if not is_team_member(membership, user_id):
             await websocket.close(code=1008, reason="Access denied")
             return
 
         # Connect to the team room
         await manager.connect(websocket, team_id, user_info)
 
-        # Send recent messages to the newly connected user
-        recent_messages = get_team_messages(team_id, 20)
-        await manager.send_personal_message(json.dumps({
-            "type": "recent_messages",
-            "messages": recent_messages
-        }), websocket)
+        if since:
+            # Reconnect: send only what the client missed, from the in-memory buffer
+            missed_messages, gap_too_large = await message_buffer.get_since(team_id, since)
+            await manager.send_personal_message(dumps_message({
+                "type": "missed_messages",
+                "messages": missed_messages,
+                "gap_too_large": gap_too_large
+            }), websocket)
+        else:
+            # Send recent messages to the newly connected user
+            recent_messages = await message_buffer.get_recent_messages(team_id, 20)
+            await manager.send_personal_message(dumps_message({
+                "type": "recent_messages",
+                "messages": recent_messages
+            }), websocket)
 
         # Listen for messages
         while True:
@@ -115,7 +397,10 @@ async def websocket_endpoint(websocket: WebSocket, team_id: str, token: str):
                 data = await websocket.receive_text()
                 message_data = json.loads(data)
                 
-                if message_data.get("type") == "chat_message":
+                if message_data.get("type") == "ping":
+                    await manager.send_personal_message(dumps_message({"type": "pong"}), websocket)
+
+                elif message_data.get("type") == "chat_message":
                     # Create and save the message
                     message_id = str(uuid.uuid4())
                     message = Message(
@@ -129,24 +414,29 @@ async def websocket_endpoint(websocket: WebSocket, team_id: str, token: str):
                         status=MessageStatus.SENT,
                         created_at=datetime.utcnow()
                     )
+                    message_doc = message.dict()
+                    message_buffer.add(message_doc)
+
+                    # Update team's last message timestamp (persisted by the debounced updater)
+                    last_message_at_updater.touch(team_id, message.created_at)
+
+                    if CHAT_WRITE_BEHIND:
+                        # Broadcast right away; the message is persisted in the background
+                        await manager.broadcast_message_to_team(team_id, message_doc)
+                        message_writer.enqueue(message_doc)
+                        message_indexer.enqueue(message_doc)
+                        continue
                     
                     # Save to database
-                    create_document("messages", message_id, message.dict())
-                    
-                    # Update team's last message timestamp
-                    update_document("teams", team_id, {"last_message_at": datetime.utcnow()})
+                    await create_document("messages", message_id, message_doc)
+                    message_indexer.enqueue(message_doc)
                     
                     # Broadcast to all team members
-                    await manager.broadcast_message_to_team(team_id, message.dict())
+                    await manager.broadcast_message_to_team(team_id, message_doc)
                 
                 elif message_data.get("type") == "typing":
-                    # Broadcast typing indicator
-                    await manager.broadcast_to_team(team_id, {
-                        "type": "typing",
-                        "user": user_info,
-                        "is_typing": message_data.get("is_typing", False),
-                        "timestamp": datetime.utcnow().isoformat()
-                    }, exclude_websocket=websocket)
+                    # Throttled per user and published as a periodic per-room typing_state frame
+                    manager.typing.update(team_id, user_info, bool(message_data.get("is_typing", False)))
                 
             except WebSocketDisconnect:
                 break
@@ -1,4 +1,5 @@
 from fastapi import FastAPI, WebSocket, Depends
+from typing import Optional
 from fastapi.middleware.cors import CORSMiddleware
 from app.routes import auth
 from app.routes.team_routes import router as team_router
@@ -7,9 +8,16 @@ from app.routes.user_routes import router as user_router
 from app.routes.todo_routes import router as todo_router
 from app.routes.assistant_routes import router as assistant_router
 from app.routes.summary_routes import router as summary_router
-from app.services.websocket_service import websocket_endpoint
+from app.services.websocket_service import websocket_endpoint, manager
+from app.services.message_writer_service import message_writer
+from app.services.message_indexer_service import message_indexer
+from app.services.team_activity_service import last_message_at_updater
 from app.dependencies.auth import get_current_user
-from app.services.firestore_service import get_user_teams
+from app.services.async_firestore_service import get_user_teams, shutdown_executor, run_in_executor
+from app.services.firestore_service import check_required_indexes
+from app.services.vector_db_service import check_vector_store, get_collection_stats
+from app.services import metrics_service
+from app.config import WEBSOCKET_PING_INTERVAL, WEBSOCKET_PING_TIMEOUT
 
 app = FastAPI(title="Workspace Management API", version="1.0.0")
 
@@ -20,6 +28,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Include routers
@@ -31,10 +40,44 @@ app.include_router(todo_router)
 app.include_router(assistant_router)
 app.include_router(summary_router)
 
+@app.on_event("startup")
+async def startup_event():
+    await manager.start()
+
+    # Open the persistent vector store now so a bad CHROMA_DB_PATH is reported at boot
+    try:
+        vector_store = await run_in_executor(check_vector_store)
+        metrics_service.register_provider("vector_store", lambda: {**vector_store, "messages": get_collection_stats()["total_messages"]})
+        if vector_store["needs_reindex"]:
+            print(f"Vector store at {vector_store['path']} is empty. "
+                  "Rebuild it with: python manage.py reindex-messages")
+    except Exception as e:
+        print(f"Vector store integrity check failed: {e}")
+
+    # Report composite indexes from firestore.indexes.json that are not deployed
+    try:
+        missing = await run_in_executor(check_required_indexes)
+    except Exception as e:
+        print(f"Skipping Firestore index self-check: {e}")
+        return
+    metrics_service.register_provider("firestore_indexes", lambda: {"missing": missing})
+    if missing:
+        print(f"Missing Firestore indexes: {', '.join(missing)}. "
+              "Deploy them with: firebase deploy --only firestore:indexes")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await manager.stop()
+    # Persist write-behind chat messages before the Firestore thread pool goes away
+    await message_writer.stop()
+    await last_message_at_updater.stop()
+    await message_indexer.stop()
+    shutdown_executor()
+
 # WebSocket endpoint
 @app.websocket("/ws/{team_id}")
-async def websocket_route(websocket: WebSocket, team_id: str, token: str):
-    await websocket_endpoint(websocket, team_id, token)
+async def websocket_route(websocket: WebSocket, team_id: str, token: str, since: Optional[str] = None):
+    await websocket_endpoint(websocket, team_id, token, since)
 
 @app.get("/")
 async def root():
@@ -44,13 +87,21 @@ async def root():
 async def health_check():
     return {"status": "healthy", "message": "API is operational"}
 
+@app.get("/metrics")
+async def metrics():
+    """Process-local counters and cache statistics"""
+    return metrics_service.snapshot()
+
 @app.get("/me/teams")
 async def get_my_teams(current_user: dict = Depends(get_current_user)):
     """Get all teams for the current user"""
     user_id = current_user.get("uid")
-    teams = get_user_teams(user_id)
-    return teams
+    teams = await get_user_teams(user_id)
+    return [last_message_at_updater.apply(team) for team in teams]
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="127.0.0.2", port=8000)
\ No newline at end of file
+    uvicorn.run(
+        app, host="127.0.0.2", port=8000,
+        ws_ping_interval=WEBSOCKET_PING_INTERVAL, ws_ping_timeout=WEBSOCKET_PING_TIMEOUT
+    )
\ No newline at end of file
@@ -0,0 +1,46 @@
+"""
+Maintenance commands for the backend.
+
+Usage (from the backend directory):
+    python manage.py backfill-member-ids
+    python manage.py backfill-todo-assignees
+    python manage.py reindex-messages [--batch-size N] [--reset]
+"""
+import argparse
+from app.config import VECTOR_REINDEX_BATCH_SIZE
+from app.services import firestore_service
+
+def backfill_member_ids(args):
+    """Populate the member_ids index on existing team documents"""
+    updated = firestore_service.backfill_team_member_ids()
+    print(f"Backfilled member_ids on {updated} team(s)")
+
+def backfill_todo_assignees(args):
+    """Populate the assigned_emails/assigned_user_ids index on existing todos"""
+    updated = firestore_service.backfill_todo_assignees()
+    print(f"Backfilled assignee index on {updated} todo(s)")
+
+def reindex_messages(args):
+    """Rebuild the persistent vector index of chat messages from Firestore"""
+    from app.services import vector_db_service
+    indexed = vector_db_service.reindex_messages(args.batch_size, reset=args.reset)
+    print(f"Indexed {indexed} message(s) into {vector_db_service.check_vector_store()['path']}")
+
+COMMANDS = {
+    "backfill-member-ids": backfill_member_ids,
+    "backfill-todo-assignees": backfill_todo_assignees,
+    "reindex-messages": reindex_messages,
+}
+
+def main():
+    parser = argparse.ArgumentParser(description="Backend maintenance commands")
+    parser.add_argument("command", choices=sorted(COMMANDS))
+    parser.add_argument("--batch-size", type=int, default=VECTOR_REINDEX_BATCH_SIZE,
+                        help="reindex-messages: messages read and embedded per batch")
+    parser.add_argument("--reset", action="store_true",
+                        help="reindex-messages: drop indexed chat messages before rebuilding")
+    args = parser.parse_args()
+    COMMANDS[args.command](args)
+
+if __name__ == "__main__":
+    main()
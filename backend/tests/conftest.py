@@ -0,0 +1,55 @@
+import json
+import sys
+from contextlib import asynccontextmanager
+from pathlib import Path
+import pytest
+
+# Make `app` importable however pytest is invoked (e.g. `pytest backend/tests` from the repo root)
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.services.pubsub_service import RedisBroker
+from app.services.websocket_service import ConnectionManager
+
+class FakeWebSocket:
+    """Accepts and records frames like a healthy client"""
+
+    def __init__(self):
+        self.frames = []
+        self.closed = False
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, data: str):
+        self.frames.append(json.loads(data))
+
+    async def close(self, code: int = 1000):
+        self.closed = True
+
+    def frames_of(self, *types: str):
+        return [frame for frame in self.frames if frame["type"] in types]
+
+@pytest.fixture
+def make_websocket():
+    return FakeWebSocket
+
+@pytest.fixture
+def redis_workers():
+    """Start ConnectionManagers for the given worker ids, sharing one fake Redis (use inside the event loop)"""
+    fakeredis = pytest.importorskip("fakeredis")
+
+    @asynccontextmanager
+    async def start(*worker_ids: str):
+        server = fakeredis.FakeServer()
+        workers = []
+        try:
+            for worker_id in worker_ids:
+                broker = RedisBroker(client=fakeredis.FakeAsyncRedis(server=server), channel_prefix="test:team:")
+                manager = ConnectionManager(broker, worker_id=worker_id)
+                await manager.start()
+                workers.append(manager)
+            yield workers
+        finally:
+            for manager in workers:
+                await manager.stop()
+    return start
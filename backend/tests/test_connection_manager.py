@@ -0,0 +1,63 @@
+import asyncio
+import random
+from app.services.pubsub_service import InProcessBroker
+from app.services.websocket_service import ConnectionManager
+
+def test_open_and_close_many_connections_leaves_no_state_behind(make_websocket):
+    connections, teams = 20000, 2000
+
+    async def scenario():
+        broker = InProcessBroker()
+        manager = ConnectionManager(broker)
+        await manager.start()
+        try:
+            sockets = []
+            for i in range(connections):
+                websocket = make_websocket()
+                # Several tabs per user in some teams
+                await manager.connect(websocket, f"team-{i % teams}", {"uid": f"user-{i % (connections // 4)}"})
+                sockets.append(websocket)
+            assert len(manager.connections) == connections
+            assert len(manager.rooms) == teams
+            assert len(broker._subscribed) == teams
+
+            for team in range(0, teams, 100):
+                await manager.broadcast_to_team(f"team-{team}", {"type": "new_message", "message": {}})
+
+            # Close in random order, interleaved with reconnects to rooms that are emptying
+            random.shuffle(sockets)
+            for i, websocket in enumerate(sockets):
+                manager.disconnect(websocket)
+                if i % 1000 == 0:
+                    await asyncio.sleep(0)
+            reopened = make_websocket()
+            await manager.connect(reopened, "team-0", {"uid": "late"})
+            manager.disconnect(reopened)
+            # Let background unsubscribes and writer cancellations run
+            for _ in range(5):
+                await asyncio.sleep(0.01)
+
+            assert manager.connections == {}
+            assert manager.rooms == {}
+            assert broker._subscribed == set()
+            assert manager.presence.stats()["online_users"] == 0
+        finally:
+            await manager.stop()
+
+    asyncio.run(scenario())
+
+def test_disconnect_is_idempotent(make_websocket):
+    async def scenario():
+        manager = ConnectionManager(InProcessBroker())
+        await manager.start()
+        try:
+            websocket = make_websocket()
+            await manager.connect(websocket, "team", {"uid": "user"})
+            manager.disconnect(websocket)
+            manager.disconnect(websocket)
+            await asyncio.sleep(0.01)
+            assert manager.connections == {} and manager.rooms == {}
+        finally:
+            await manager.stop()
+
+    asyncio.run(scenario())
@@ -0,0 +1,41 @@
+import asyncio
+
+def presence_events(websocket):
+    return [frame["type"] for frame in websocket.frames_of("user_joined", "user_left")]
+
+def test_presence_is_shared_across_workers(make_websocket, redis_workers):
+    async def scenario():
+        async with redis_workers("worker-a", "worker-b") as workers:
+            a, b = workers
+            observer, tab_a, tab_b = make_websocket(), make_websocket(), make_websocket()
+            await a.connect(observer, "team", {"uid": "bob"})
+            # Alice opens a tab on each worker: one join, and both workers list her once with two connections
+            await a.connect(tab_a, "team", {"uid": "alice"})
+            await b.connect(tab_b, "team", {"uid": "alice"})
+            await asyncio.sleep(0.2)
+            assert presence_events(observer) == ["user_joined"]
+            for manager in workers:
+                online = {user["uid"]: user["connections"] for user in await manager.online_members("team")}
+                assert online == {"bob": 1, "alice": 2}
+
+            # Closing one tab isn't a leave; closing the last one is
+            a.disconnect(tab_a)
+            await asyncio.sleep(0.2)
+            assert presence_events(observer) == ["user_joined"]
+            b.disconnect(tab_b)
+            await asyncio.sleep(0.2)
+            assert presence_events(observer) == ["user_joined", "user_left"]
+            assert [user["uid"] for user in await b.online_members("team")] == ["bob"]
+
+            # Tabs on the same worker update the shared count right away
+            tabs = [make_websocket(), make_websocket()]
+            for tab in tabs:
+                await a.connect(tab, "team", {"uid": "carol"})
+            online = {user["uid"]: user["connections"] for user in await b.online_members("team")}
+            assert online == {"bob": 1, "carol": 2}
+            a.disconnect(tabs[0])
+            await asyncio.sleep(0.2)
+            online = {user["uid"]: user["connections"] for user in await b.online_members("team")}
+            assert online == {"bob": 1, "carol": 1}
+
+    asyncio.run(scenario())
@@ -0,0 +1,69 @@
+import asyncio
+import pytest
+from app.services.pubsub_service import InProcessBroker, RedisBroker
+
+fakeredis = pytest.importorskip("fakeredis")
+
+async def wait_for(condition, timeout=2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        if asyncio.get_running_loop().time() > deadline:
+            raise AssertionError("condition not met in time")
+        await asyncio.sleep(0.01)
+
+def start_worker(server, received):
+    """A RedisBroker as one worker would create it, sharing the fake Redis server"""
+    broker = RedisBroker(client=fakeredis.FakeAsyncRedis(server=server), channel_prefix="test:team:")
+
+    async def handler(team_id, message):
+        received.append((team_id, message))
+    return broker, handler
+
+def test_redis_broker_fans_out_across_workers():
+    async def scenario():
+        server = fakeredis.FakeServer()
+        received_a, received_b = [], []
+        worker_a, handler_a = start_worker(server, received_a)
+        worker_b, handler_b = start_worker(server, received_b)
+        await worker_a.start(handler_a)
+        await worker_b.start(handler_b)
+        try:
+            await worker_a.subscribe("t1")
+            await worker_b.subscribe("t1")
+            await worker_b.subscribe("t2")
+
+            await worker_a.publish("t1", "hello")
+            await worker_a.publish("t2", "only b")
+            await wait_for(lambda: len(received_a) == 1 and len(received_b) == 2)
+            assert received_a == [("t1", "hello")]
+            assert sorted(received_b) == [("t1", "hello"), ("t2", "only b")]
+
+            # A worker whose room emptied stops receiving that team's messages
+            await worker_b.unsubscribe("t1")
+            await worker_a.publish("t1", "after unsubscribe")
+            await wait_for(lambda: len(received_a) == 2)
+            await asyncio.sleep(0.1)
+            assert received_b[-1] != ("t1", "after unsubscribe")
+        finally:
+            await worker_a.stop()
+            await worker_b.stop()
+
+    asyncio.run(scenario())
+
+def test_in_process_broker_delivers_only_subscribed_teams():
+    async def scenario():
+        received = []
+
+        async def handler(team_id, message):
+            received.append((team_id, message))
+        broker = InProcessBroker()
+        await broker.start(handler)
+        await broker.subscribe("t1")
+        await broker.publish("t1", "hello")
+        await broker.publish("t2", "nobody listening")
+        await broker.unsubscribe("t1")
+        await broker.publish("t1", "after unsubscribe")
+        await broker.stop()
+        assert received == [("t1", "hello")]
+
+    asyncio.run(scenario())
@@ -0,0 +1,27 @@
+import asyncio
+from app.config import TYPING_BROADCAST_INTERVAL, TYPING_THROTTLE_INTERVAL
+
+def typing_users(websocket):
+    states = websocket.frames_of("typing_state")
+    return sorted(user["uid"] for user in states[-1]["users"]) if states else None
+
+def test_typing_state_is_merged_across_workers(make_websocket, redis_workers):
+    async def scenario():
+        async with redis_workers("worker-a", "worker-b") as (a, b):
+            socket_a, socket_b = make_websocket(), make_websocket()
+            await a.connect(socket_a, "team", {"uid": "alice"})
+            await b.connect(socket_b, "team", {"uid": "bob"})
+            a.typing.update("team", {"uid": "alice"}, True)
+            b.typing.update("team", {"uid": "bob"}, True)
+            await asyncio.sleep(TYPING_BROADCAST_INTERVAL + 0.3)
+            assert typing_users(socket_a) == ["alice", "bob"]
+            assert typing_users(socket_b) == ["alice", "bob"]
+
+            # Bob stops typing on worker B; both workers' clients now see only Alice
+            await asyncio.sleep(TYPING_THROTTLE_INTERVAL)
+            b.typing.update("team", {"uid": "bob"}, False)
+            await asyncio.sleep(TYPING_BROADCAST_INTERVAL + 0.3)
+            assert typing_users(socket_a) == ["alice"]
+            assert typing_users(socket_b) == ["alice"]
+
+    asyncio.run(scenario())